@@ -1,18 +1,31 @@
 #
 # Write a set of fields into a CSV file
 #
+# The file is held open and flushed periodically, optionally rotated by
+# UTC day or size, and optionally compressed.
+#
 # June-2021, Pat Welch, pat@mousebrains.com
 
 from argparse import ArgumentParser
 from TPWUtils.Thread import Thread
+from AIS.BoundedQueue import BoundedQueue
+from AIS.Message import Message
 import logging
 import queue
+import gzip
+import time
 import os.path
+from datetime import datetime, timezone
+try:
+    import zstandard
+    qZSTD = True
+except:
+    qZSTD = False
 
 class AIS2CSV(Thread):
     def __init__(self, args:ArgumentParser) -> None:
         Thread.__init__(self, "AIS2CSV", args)
-        self.__queue = queue.Queue()
+        self.__queue = BoundedQueue("AIS2CSV", args)
 
     @staticmethod
     def addArgs(parser:ArgumentParser) -> None:
@@ -21,39 +34,150 @@ class AIS2CSV(Thread):
                 help="Filename to write CSV records to")
         grp.add_argument("--csvFields", type=str, action="append",
                 help="Fields to write out, defaults to t,mmsi,x,y,sog,cog")
+        grp.add_argument("--csvFlush", type=float, default=10,
+                help="Seconds between flushes of the CSV file")
+        grp.add_argument("--csvRotate", type=str, default="none", choices=("none", "day", "size"),
+                help="Start a new CSV file each UTC day or after --csvMaxSize bytes")
+        grp.add_argument("--csvMaxSize", type=int, default=10 * 1024 * 1024,
+                help="Uncompressed bytes per CSV file for --csvRotate=size")
+        choices = ["none", "gzip"]
+        if qZSTD: choices.append("zstd")
+        grp.add_argument("--csvCompress", type=str, default="none", choices=choices,
+                help="Compress the CSV files")
 
     @staticmethod
     def qUse(args:ArgumentParser) -> bool:
         if args.csv: return True
 
-    def put(self, payload:dict) -> None:
+    def put(self, payload:Message) -> None:
         self.__queue.put(payload)
 
+    def drain(self) -> None:
+        ''' Wait until every message put has been written and flushed, so it is readable '''
+        self.__queue.join()
+
+    def __segmentName(self, t:float) -> str:
+        args = self.args
+        (stem, ext) = os.path.splitext(args.csv)
+        suffix = {"none": "", "gzip": ".gz", "zstd": ".zst"}[args.csvCompress]
+        if args.csvRotate == "day":
+            stem += datetime.fromtimestamp(t, tz=timezone.utc).strftime(".%Y%m%d")
+        elif args.csvRotate == "size":
+            stem += datetime.fromtimestamp(t, tz=timezone.utc).strftime(".%Y%m%dT%H%M%S")
+        fn = stem + ext + suffix
+        if suffix or args.csvRotate == "size":
+            # Never append to an existing compressed or size rotated file,
+            # a compressed file may have been truncated mid-stream by a crash
+            cnt = 0
+            while os.path.exists(fn):
+                cnt += 1
+                fn = f"{stem}.{cnt}{ext}{suffix}"
+        return fn
+
+    @staticmethod
+    def __recover(fn:str) -> int:
+        ''' Truncate a partial last line left by a crash, return the file size '''
+        with open(fn, "r+b") as fp:
+            sz = fp.seek(0, os.SEEK_END)
+            pos = max(0, sz - 4096)
+            fp.seek(pos)
+            tail = fp.read()
+            index = tail.rfind(b"\n")
+            keep = pos + index + 1 if index >= 0 else 0
+            if keep < sz:
+                logging.warning("Truncating partial line in %s, %s -> %s", fn, sz, keep)
+                fp.truncate(keep)
+            return keep
+
+    def __open(self, t:float, header:str) -> tuple:
+        args = self.args
+        fn = self.__segmentName(t)
+        sz = self.__recover(fn) if os.path.exists(fn) else 0
+        logging.info("Opening %s", fn)
+        if args.csvCompress == "gzip":
+            fp = gzip.open(fn, "wt")
+        elif args.csvCompress == "zstd":
+            fp = zstandard.open(fn, "wt")
+        else:
+            fp = open(fn, "a")
+        if sz == 0: # Write the header
+            fp.write(header)
+            sz = len(header)
+        return (fp, fn, sz)
+
+    def __flush(self, fp, fn:str):
+        '''
+        Flush so a reader sees complete compressed data, not just bytes on disk,
+        gzip starts a new member and zstd ends its frame, return the file to write to
+        '''
+        compress = self.args.csvCompress
+        if compress == "gzip": # Concatenated gzip members are a valid gzip file
+            fp.close()
+            return gzip.open(fn, "at")
+        fp.flush()
+        if compress == "zstd": # As are concatenated zstd frames
+            fp.buffer.flush(zstandard.FLUSH_FRAME)
+        return fp
+
     def runIt(self): # Called on thread start
         q = self.__queue
         args = self.args
-        fn = args.csv
         fields = ["t", "mmsi", "x", "y", "sog", "cog"]
         if args.csvFields:
             fields = args.csvFields
-        logging.info("Starting %s <- %s", fn, fields)
-        if not os.path.exists(fn): # Write the header
-            with open(fn, "w") as fp:
-                fp.write(",".join(fields) + "\n")
-
-        while True:
-            info = q.get()
-            logging.debug("Recv: %s", info)
-            values = []
-            qWrite = False
-            for fld in fields:
-                if fld in info and info[fld]:
-                    values.append(str(info[fld]))
-                    qWrite = True
+        header = ",".join(fields) + "\n"
+        logging.info("Starting %s <- %s", args.csv, fields)
+        fp = None # Current CSV file
+        fn = None
+        sz = 0 # Uncompressed bytes in the current file
+        day = None # UTC day of the current file
+        tFlush = None # When to flush the current file
+        nPending = 0 # Messages written but not flushed, so not yet task_done
+
+        try:
+            while True:
+                try:
+                    dt = None if tFlush is None else max(0, tFlush - time.time())
+                    info = q.get(timeout=dt)
+                except queue.Empty:
+                    info = None
+                if fp and tFlush is not None and (info is None or time.time() >= tFlush):
+                    fp = self.__flush(fp, fn)
+                    tFlush = None
+                    for i in range(nPending): q.task_done()
+                    nPending = 0
+                if info is None: continue
+
+                logging.debug("Recv: %s", info)
+                values = []
+                qWrite = False
+                for fld in fields:
+                    if fld in info and info[fld]:
+                        values.append(str(info[fld]))
+                        qWrite = True
+                    else:
+                        values.append("")
+                if qWrite:
+                    t = info["t"] if "t" in info else time.time()
+                    tDay = int(t // 86400)
+                    if fp and ((args.csvRotate == "day" and tDay != day)
+                            or (args.csvRotate == "size" and sz >= args.csvMaxSize)):
+                        logging.info("Closing %s size %s", fn, sz)
+                        fp.close()
+                        fp = None
+                        tFlush = None
+                        for i in range(nPending): q.task_done()
+                        nPending = 0
+                    if fp is None:
+                        (fp, fn, sz) = self.__open(t, header)
+                        day = tDay
+                    line = ",".join(values) + "\n"
+                    logging.debug("Writing: %s %s -> %s", fn, fields, values)
+                    fp.write(line)
+                    sz += len(line)
+                    if tFlush is None: tFlush = time.time() + args.csvFlush
+                    nPending += 1
                 else:
-                    values.append("")
-            if qWrite:
-                logging.debug("Writing: %s %s -> %s", fn, fields, values)
-                with open(fn, "a") as fp:
-                    fp.write(",".join(values) + "\n")
-            q.task_done()
+                    q.task_done()
+        finally:
+            if fp: fp.close()
@@ -5,19 +5,22 @@
 
 from argparse import ArgumentParser
 from TPWUtils.Thread import Thread
+from AIS.BoundedQueue import BoundedQueue
+from AIS.Message import Message
 import logging
 import queue
 import sqlite3
-try:
-    import psycopg3
+import time
+try: # See if this system has psycopg installed
+    import psycopg
     qPSQL = True
-except:
+except ImportError:
     qPSQL = False
 
 class AIS2DB(Thread):
     def __init__(self, args:ArgumentParser) -> None:
         Thread.__init__(self, "AIS2DB", args)
-        self.__queue = queue.Queue()
+        self.__queue = BoundedQueue("AIS2DB", args)
 
     @staticmethod
     def addArgs(parser:ArgumentParser) -> None:
@@ -25,6 +28,14 @@ class AIS2DB(Thread):
         grp.add_argument("--ais2dbFields", type=str, default="aisFields",
                 help="AIS field table name")
         grp.add_argument("--ais2dbTable", type=str, default="ais", help="AIS table name")
+        grp.add_argument("--ais2dbPositions", type=str,
+                help="Typed position table name, (mmsi,t,x,y,sog,cog,heading,nav_status)")
+        grp.add_argument("--ais2dbStatic", type=str,
+                help="Typed static table name, (mmsi,t,name,callsign,destination,ship_type)")
+        grp.add_argument("--ais2dbBatch", type=int, default=1000,
+                help="Maximum number of messages to write in a single transaction")
+        grp.add_argument("--ais2dbMaxDelay", type=float, default=1,
+                help="Maximum number of seconds to hold a message before writing it")
         gg = grp.add_mutually_exclusive_group()
         gg.add_argument("--ais2dbSQLite3", type=str, help="SQLite3 database to write to")
         if qPSQL:
@@ -35,9 +46,13 @@ class AIS2DB(Thread):
         if args.ais2dbSQLite3: return True
         return qPSQL and args.ais2dbPostgreSQL
 
-    def put(self, payload:dict) -> None:
+    def put(self, payload:Message) -> None:
         self.__queue.put(payload)
 
+    def drain(self) -> None:
+        ''' Wait until every message put has been written '''
+        self.__queue.join()
+
     def runIt(self): # Called on thread start
         args = self.args
         qSQLite3 = args.ais2dbSQLite3
@@ -45,7 +60,7 @@ class AIS2DB(Thread):
         logging.info("Starting %s %s", dbname, args.ais2dbTable)
         with sqlite3.connect(dbname) \
                 if qSQLite3 else \
-                psycopg3.connect(dbname) \
+                psycopg.connect(dbname=dbname, autocommit=True) \
                 as db:
                     self.__mkTable(db)
                     self.__process(db)
@@ -65,33 +80,129 @@ class AIS2DB(Thread):
         # This should not be needed due to the primary key is this index
         # sql1 = f"CREATE INDEX IF NOT EXISTS {tbl}_index ON {tbl} (mmsi,key,t);"
 
+        # For readers scanning one key by time, e.g. WaveGlider/AIS.py,
+        # built here so the readers never need to write to the database
+        sql2 = f"CREATE INDEX IF NOT EXISTS {tbl}_key_t ON {tbl} (key,t);"
+
         # logging.debug("Creating table:\n%s\n%s", sql0, sql1)
-        logging.debug("Creating table:\n%s\n%s", sql0)
+        logging.debug("Creating table:\n%s\n%s", sql0, sql2)
         db.cursor().execute("BEGIN;")
         db.cursor().execute(sql0)
         # db.cursor().execute(sql1)
+        db.cursor().execute(sql2)
+        for sql in self.__mkPositions() + self.__mkStatic():
+            logging.debug("Creating:\n%s", sql)
+            db.cursor().execute(sql)
         db.cursor().execute("COMMIT;")
 
-    def __process(self, db) -> None:
-        tbl = self.args.ais2dbTable
+    def __mkPositions(self) -> list:
+        tbl = self.args.ais2dbPositions
+        if not tbl: return []
+        sql = f"CREATE TABLE IF NOT EXISTS {tbl} (\n"
+        sql+=  "  mmsi INTEGER, -- AIS unique identifier\n"
+        sql+=  "  t DOUBLE PRECISION, -- UTC seconds\n"
+        sql+=  "  x DOUBLE PRECISION, -- Longitude decimal degrees\n"
+        sql+=  "  y DOUBLE PRECISION, -- Latitude decimal degrees\n"
+        sql+=  "  sog REAL, -- Speed over ground in knots\n"
+        sql+=  "  cog REAL, -- Course over ground in degrees true\n"
+        sql+=  "  heading REAL, -- True heading in degrees, 511 is not available\n"
+        sql+=  "  nav_status INTEGER, -- Navigation status\n"
+        sql+=  "  PRIMARY KEY(mmsi, t)\n"
+        sql+= f"); -- {tbl}"
+        return [sql, f"CREATE INDEX IF NOT EXISTS {tbl}_t ON {tbl} (t);"]
+
+    def __mkStatic(self) -> list:
+        tbl = self.args.ais2dbStatic
+        if not tbl: return []
+        sql = f"CREATE TABLE IF NOT EXISTS {tbl} (\n"
+        sql+=  "  mmsi INTEGER PRIMARY KEY, -- AIS unique identifier\n"
+        sql+=  "  t DOUBLE PRECISION, -- UTC seconds of the last update\n"
+        sql+=  "  name TEXT, -- Vessel name\n"
+        sql+=  "  callsign TEXT, -- Radio callsign\n"
+        sql+=  "  destination TEXT, -- Reported destination\n"
+        sql+=  "  ship_type INTEGER -- Ship type and cargo code\n"
+        sql+= f"); -- {tbl}"
+        return [sql, f"CREATE INDEX IF NOT EXISTS {tbl}_t ON {tbl} (t);"]
+
+    def __getBatch(self) -> list:
+        # Block for the first message, then drain the queue until either
+        # the batch is full or the first message has waited long enough
         q = self.__queue
-        sql = f"INSERT INTO {tbl} VALUES(?,?,?,?) ON CONFLICT DO NOTHING;"
+        args = self.args
+        batch = [q.get()]
+        tEnd = time.time() + args.ais2dbMaxDelay
+        while len(batch) < args.ais2dbBatch:
+            dt = tEnd - time.time()
+            try:
+                batch.append(q.get(timeout=dt) if dt > 0 else q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    @staticmethod
+    def __positionRow(info:dict) -> tuple:
+        if "x" not in info or "y" not in info: return None
+        return (info["mmsi"], info["t"], info["x"], info["y"],
+                info.get("sog"), info.get("cog"), info.get("true_heading"),
+                info.get("nav_status"))
+
+    @staticmethod
+    def __staticRow(info:dict) -> tuple:
+        row = [info["mmsi"], info["t"]]
+        qStatic = False
+        for key in ["name", "callsign", "destination"]:
+            val = info[key].strip(" \t\n\r@") if key in info else None
+            row.append(val if val else None)
+            qStatic |= bool(val)
+        row.append(info.get("type_and_cargo"))
+        qStatic |= row[-1] is not None
+        return tuple(row) if qStatic else None
+
+    def __process(self, db) -> None:
+        args = self.args
+        tbl = args.ais2dbTable
+        tblPos = args.ais2dbPositions
+        tblStatic = args.ais2dbStatic
+        requiredKeys = ["mmsi", "t"]
+        marker = "?" if args.ais2dbSQLite3 else "%s"
+        sql = f"INSERT INTO {tbl} VALUES({marker},{marker},{marker},{marker})"
+        sql+= " ON CONFLICT DO NOTHING;"
         logging.debug("%s", sql)
+        sqlPos = f"INSERT INTO {tblPos} VALUES(" + ",".join([marker] * 8) + ")"
+        sqlPos+= " ON CONFLICT DO NOTHING;"
+        sqlStatic = f"INSERT INTO {tblStatic} VALUES(" + ",".join([marker] * 6) + ")"
+        sqlStatic+= " ON CONFLICT (mmsi) DO UPDATE SET t=excluded.t"
+        for key in ["name", "callsign", "destination", "ship_type"]:
+            sqlStatic+= f",{key}=COALESCE(excluded.{key},{tblStatic}.{key})"
+        sqlStatic+= ";"
         cur = db.cursor()
         while True:
-            info = q.get() # Get the decrypted AIS message as a dictionary
-            q.task_done()
-            requiredKeys = ["mmsi", "t"]
-            qGood = True
-            for key in requiredKeys:
-                if key not in info:
-                    logging.warning("No %s field found in %s", key, info)
-                    qGood = False
-            if not qGood: continue
-            mmsi = info["mmsi"]
-            t = info["t"]
-            cur.execute("BEGIN;")
-            for key in info:
-                if key not in requiredKeys: # Key to save
-                    cur.execute(sql, (mmsi, key, t, info[key]))
-            cur.execute("COMMIT;")
+            rows = []
+            positions = []
+            statics = []
+            batch = self.__getBatch()
+            for info in batch: # Decrypted AIS messages as dictionaries
+                qGood = True
+                for key in requiredKeys:
+                    if key not in info:
+                        logging.warning("No %s field found in %s", key, info)
+                        qGood = False
+                if not qGood: continue
+                mmsi = info["mmsi"]
+                t = info["t"]
+                for key in info:
+                    if key not in requiredKeys: # Key to save
+                        rows.append((mmsi, key, t, info[key]))
+                row = self.__positionRow(info) if tblPos else None
+                if row: positions.append(row)
+                row = self.__staticRow(info) if tblStatic else None
+                if row: statics.append(row)
+            if rows:
+                logging.debug("Writing %s rows %s positions %s static",
+                        len(rows), len(positions), len(statics))
+                cur.execute("BEGIN;")
+                cur.executemany(sql, rows)
+                if positions: cur.executemany(sqlPos, positions)
+                if statics: cur.executemany(sqlStatic, statics)
+                cur.execute("COMMIT;")
+            for info in batch: self.__queue.task_done()
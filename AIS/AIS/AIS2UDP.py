@@ -1,33 +1,63 @@
 #
 # Send decoded AIS messages as a JSON message to UDP ports
 #
+# Optionally coalesce several messages into one datagram up to an MTU,
+# send only the fields which changed since the last message for an MMSI,
+# and use a more compact encoding, msgpack or CBOR.
+#
 # June-2021, Pat Welch, pat@mousebrains.com
 
 from argparse import ArgumentParser
 from TPWUtils.Thread import Thread
+from AIS.BoundedQueue import BoundedQueue
+from AIS.Message import Message
 import logging
 import queue
 import socket
 import re
 import json
 import time
+from collections import OrderedDict
+try:
+    import msgpack
+    qMsgPack = True
+except:
+    qMsgPack = False
+try:
+    import cbor2
+    qCBOR = True
+except:
+    qCBOR = False
 
 class AIS2UDP(Thread):
     def __init__(self, args:ArgumentParser) -> None:
         Thread.__init__(self, "AIS2UDP", args)
-        self.__queue = queue.Queue()
+        self.__queue = BoundedQueue("AIS2UDP", args)
 
     @staticmethod
     def addArgs(parser:ArgumentParser) -> None:
         grp = parser.add_argument_group(description="AIS2UDP related options")
         grp.add_argument("--ais2udp", type=str, action="append",
                 help="IP:port or hostname:port to send JSON messages to")
+        choices = ["json"]
+        if qMsgPack: choices.append("msgpack")
+        if qCBOR: choices.append("cbor")
+        grp.add_argument("--ais2udpEncoding", type=str, default="json", choices=choices,
+                help="How to encode messages")
+        grp.add_argument("--ais2udpMTU", type=int, default=0,
+                help="Coalesce messages into an array up to this many bytes, 0 is one per datagram")
+        grp.add_argument("--ais2udpMaxDelay", type=float, default=1,
+                help="Maximum seconds to hold a message while coalescing")
+        grp.add_argument("--ais2udpDelta", action="store_true",
+                help="Only send fields which changed since the last message for an MMSI")
+        grp.add_argument("--ais2udpRefresh", type=float, default=600,
+                help="Seconds between sending all the fields for an MMSI with --ais2udpDelta")
 
     @staticmethod
     def qUse(args:ArgumentParser) -> bool:
         if args.ais2udp: return True
 
-    def put(self, payload:dict) -> None:
+    def put(self, payload:Message) -> None:
         self.__queue.put(payload)
 
     def __mkTargets(self) -> set:
@@ -46,17 +76,90 @@ class AIS2UDP(Thread):
                 raise e
         return targets
 
+    def __mkEncoder(self) -> tuple:
+        ''' Return functions to encode a message and to frame a list of encoded messages '''
+        encoding = self.args.ais2udpEncoding
+        if encoding == "msgpack":
+            def header(n:int) -> bytes: # msgpack array header
+                return bytes([0x90 | n]) if n < 16 else b"\xdc" + n.to_bytes(2, "big")
+            return (msgpack.packb, lambda parts: header(len(parts)) + b"".join(parts))
+        if encoding == "cbor":
+            def header(n:int) -> bytes: # CBOR array header
+                if n < 24: return bytes([0x80 | n])
+                if n < 256: return bytes([0x98, n])
+                return b"\x99" + n.to_bytes(2, "big")
+            return (cbor2.dumps, lambda parts: header(len(parts)) + b"".join(parts))
+        return (lambda payload: bytes(json.dumps(payload), "utf-8"),
+                lambda parts: b"[" + b",".join(parts) + b"]")
+
+    def __mkDelta(self):
+        ''' Return a function which reduces a message to the fields which changed '''
+        args = self.args
+        previous = OrderedDict() # mmsi -> (time of last full send, fields sent), oldest first
+        refresh = args.ais2udpRefresh
+
+        def delta(payload:dict) -> dict:
+            if "mmsi" not in payload: return payload
+            mmsi = payload["mmsi"]
+            now = time.time()
+            while previous: # Forget about MMSIs which have not been seen for a while
+                (key, (tFull, sent)) = next(iter(previous.items()))
+                if tFull > (now - refresh): break
+                del previous[key]
+            if mmsi in previous:
+                (tFull, sent) = previous[mmsi]
+                changes = {key: payload[key] for key in payload
+                        if key not in sent or sent[key] != payload[key]}
+                changes["mmsi"] = mmsi
+                previous[mmsi] = (tFull, payload)
+                return changes
+            previous[mmsi] = (now, payload) # Full message, so start the refresh clock
+            return payload
+
+        return delta
+
     def runIt(self): # Called on thread start
         q = self.__queue
         args = self.args
         targets = self.__mkTargets()
         logging.info("Starting %s", targets)
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        while True:
-            payload = q.get()
-            msg = json.dumps(payload)
-            logging.debug("Recv: %s", msg)
+        (encode, frame) = self.__mkEncoder()
+        delta = self.__mkDelta() if args.ais2udpDelta else None
+        mtu = args.ais2udpMTU - 3 # Leave room for the array header
+        parts = [] # Encoded messages waiting to be sent
+        sz = 0 # Size of parts including separators
+        tEnd = None # When parts must be sent by
+
+        def send(msg:bytes) -> None:
             for tgt in targets:
-                logging.debug("Sending to %s", tgt)
-                sock.sendto(bytes(msg, "utf-8"), tgt)
-            q.task_done()
+                logging.debug("Sending %s bytes to %s", len(msg), tgt)
+                sock.sendto(msg, tgt)
+
+        while True:
+            try:
+                dt = None if tEnd is None else max(0, tEnd - time.time())
+                payload = q.get(timeout=dt)
+            except queue.Empty:
+                payload = None
+
+            if payload is not None:
+                logging.debug("Recv: %s", payload)
+                msg = encode(delta(payload) if delta else payload)
+                q.task_done()
+                if mtu <= 0: # Not coalescing
+                    send(msg)
+                    continue
+                if parts and (sz + len(msg) + 1) > mtu: # Won't fit, so send what I have
+                    send(frame(parts))
+                    parts = []
+                    sz = 0
+                parts.append(msg)
+                sz += len(msg) + 1
+                if tEnd is None: tEnd = time.time() + args.ais2udpMaxDelay
+
+            if parts and (payload is None or time.time() >= tEnd):
+                send(frame(parts))
+                parts = []
+                sz = 0
+                tEnd = None
@@ -6,15 +6,19 @@
 
 from argparse import ArgumentParser
 from TPWUtils.Thread import Thread
+from AIS.BoundedQueue import BoundedQueue, QueueStats
+from AIS.Message import Message
 import logging
-import queue
 import time
+from collections import OrderedDict
 
 class Accumulator(Thread):
     def __init__(self, args:ArgumentParser) -> None:
         Thread.__init__(self, "ACCUM", args)
         self.__qOutput = set()
-        self.__qInput = queue.Queue()
+        self.__qInput = BoundedQueue("ACCUM", args)
+        self.__historical = {} # Accumulated message for each MMSI
+        QueueStats.addGauge("vessels", lambda: len(self.__historical))
 
     @staticmethod
     def addArgs(parser:ArgumentParser) -> None:
@@ -28,10 +32,10 @@ class Accumulator(Thread):
     def queue(self, q) -> None:
         self.__qOutput.add(q)
 
-    def put(self, payload:dict) -> None:
+    def put(self, payload:Message) -> None:
         self.__qInput.put(payload)
 
-    def send(self, payload:dict) -> None:
+    def send(self, payload:Message) -> None:
         for q in self.__qOutput:
             q.put(payload)
 
@@ -40,8 +44,8 @@ class Accumulator(Thread):
         args = self.args
         maxAge = args.accumAge if args.accumAge > 0 else None
         logging.info("Starting max age %s", maxAge)
-        historical = {}
-        ages = {}
+        historical = self.__historical
+        ages = OrderedDict() # MMSI -> time last seen, least recently seen first
         toDrop = {
                 "ais_version", 
                 "band_flag",  # Frequency band
@@ -60,26 +64,28 @@ class Accumulator(Thread):
                 "utc_year", "utc_month", "utc_day", "utc_hour", "utc_min", "utc_spare",
                 }
         while True:
-            info = q.get().copy() # Make sure we have a local copy
-            for key in toDrop:
-                if key in info: # Drop flags I don't want to pass on
-                    del info[key]
+            msg = q.get() # Shared with other consumers, so build a new dictionary
+            info = {key: msg[key] for key in msg if key not in toDrop} # Drop flags I don't want
             for key in ["callsign", "destination", "name"]:
                 if key in info:
                     info[key] = info[key].strip(" \t\n\r@")
             if maxAge and "mmsi" in info:
                 mmsi = info["mmsi"]
-                if mmsi not in historical:
-                    historical[mmsi] = info
+                if mmsi in historical: # Copy-on-write, consumers may hold the previous one
+                    info = historical[mmsi].evolve(info)
                 else:
-                    historical[mmsi].update(info)
+                    info = Message(info)
+                historical[mmsi] = info
                 ages[mmsi] = time.time()
-                info = historical[mmsi]
+                ages.move_to_end(mmsi) # Keep ages ordered by time last seen
+            else:
+                info = Message(info)
             self.send(info)
             q.task_done()
             if ages:
                 t0 = time.time() - maxAge # Toss anything older than this
-                for mmsi in list(ages.keys()): # list is to force a copy of all the keys
-                    if ages[mmsi] <= t0: # Prune the unused entries
-                        del historical[mmsi]
-                        del ages[mmsi]
+                while ages: # Oldest first, so only the entries being pruned are visited
+                    (mmsi, tSeen) = next(iter(ages.items()))
+                    if tSeen > t0: break
+                    ages.popitem(last=False) # Prune the unused entries
+                    del historical[mmsi]
@@ -0,0 +1,94 @@
+#
+# Bounded queue with a selectable overflow policy and drop/high-water accounting,
+# plus a thread that periodically logs the statistics of every queue and other gauges.
+#
+# Oct-2026, Pat Welch, pat@mousebrains.com
+
+from argparse import ArgumentParser
+from TPWUtils.Thread import Thread
+import logging
+import queue
+import time
+
+class BoundedQueue(queue.Queue):
+    __Policies = ("block", "dropOldest", "dropNewest")
+    __queues = [] # Every queue created, for QueueStats
+
+    def __init__(self, name:str, args:ArgumentParser, policy:str=None) -> None:
+        ''' policy is this edge's default in place of --queuePolicy, e.g. block for archives '''
+        policies = dict(item.split("=", 1) for item in (args.queueEdge or []))
+        policy = policies.get(name, args.queuePolicy if policy is None else policy)
+        if policy not in self.__Policies:
+            raise ValueError(f"Unknown queue policy {policy} for {name}")
+        queue.Queue.__init__(self, maxsize=max(args.queueSize, 0))
+        self.name = name
+        self.policy = policy
+        self.nPut = 0 # Number of items put
+        self.nDropped = 0 # Number of items dropped
+        self.highWater = 0 # Maximum number of items waiting
+        self.__queues.append(self)
+
+    @classmethod
+    def addArgs(cls, parser:ArgumentParser) -> None:
+        grp = parser.add_argument_group(description="Queue related options")
+        grp.add_argument("--queueSize", type=int, default=10000,
+                help="Maximum number of items waiting for each consumer, 0 is unbounded;"
+                + " consumers of the reader count batches of datagrams, not datagrams")
+        grp.add_argument("--queuePolicy", type=str, default="dropOldest",
+                choices=cls.__Policies,
+                help="What to do when a consumer's queue is full, R2DB and R2LOG default to block")
+        grp.add_argument("--queueEdge", type=str, action="append", metavar="AIS2DB=block",
+                help="Policy for a specific consumer, overriding --queuePolicy and its default")
+        grp.add_argument("--queueStats", type=float, default=600,
+                help="Seconds between queue statistics log lines, 0 disables")
+
+    @classmethod
+    def queues(cls) -> list:
+        return list(cls.__queues)
+
+    def put(self, item, block:bool=True, timeout:float=None) -> None:
+        if self.policy == "block":
+            queue.Queue.put(self, item, block, timeout)
+            return
+
+        with self.not_full:
+            if 0 < self.maxsize <= self._qsize():
+                self.nDropped += 1
+                if self.policy == "dropNewest": return
+                self._get() # Drop the oldest item, which will never see a task_done
+                self.unfinished_tasks -= 1
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def _put(self, item) -> None: # Called with the mutex held
+        queue.Queue._put(self, item)
+        self.nPut += 1
+        self.highWater = max(self.highWater, self._qsize())
+
+class QueueStats(Thread):
+    __gauges = {} # Other values to log, name -> function returning the current value
+
+    def __init__(self, args:ArgumentParser) -> None:
+        Thread.__init__(self, "QSTATS", args)
+
+    @classmethod
+    def addGauge(cls, name:str, func) -> None:
+        cls.__gauges[name] = func
+
+    @staticmethod
+    def qUse(args:ArgumentParser) -> bool:
+        return args.queueStats > 0
+
+    def runIt(self) -> None: # Called on thread start
+        dt = self.args.queueStats
+        logging.info("Starting dt %s", dt)
+        while True:
+            time.sleep(dt)
+            items = []
+            for q in BoundedQueue.queues():
+                items.append(f"{q.name} n={q.qsize()} hw={q.highWater}"
+                        + f" put={q.nPut} dropped={q.nDropped}")
+            for name in self.__gauges:
+                items.append(f"{name}={self.__gauges[name]()}")
+            logging.info("%s", ", ".join(items))
@@ -0,0 +1,163 @@
+#
+# Drop decoded AIS messages for vessels outside our operating area
+# before they reach the Accumulator and the sinks.
+#
+# The area is a lat/lon polygon and/or a radius around our own ship,
+# whose position is taken from its own AIS messages.
+# Messages without a position, i.e. static and voyage data, pass
+# if the vessel was recently seen inside the area.
+# MMSIs can be always allowed or always denied.
+#
+# Oct-2026, Pat Welch, pat@mousebrains.com
+
+from argparse import ArgumentParser
+from TPWUtils.Thread import Thread
+from AIS.BoundedQueue import BoundedQueue, QueueStats
+from AIS.Message import Message
+import logging
+import queue
+import math
+from collections import OrderedDict
+
+def mkPolygon(polygon:str) -> list:
+    ''' "lat,lon lat,lon ..." -> [(lon, lat), ...] '''
+    vertices = []
+    for item in polygon.split():
+        (lat, lon) = item.split(",")
+        vertices.append((float(lon), float(lat)))
+    if len(vertices) < 3:
+        raise ValueError(f"A polygon needs at least three vertices, {polygon}")
+    return vertices
+
+def inPolygon(x:float, y:float, vertices:list) -> bool:
+    ''' Ray casting test for lon x, lat y '''
+    qInside = False
+    (x0, y0) = vertices[-1]
+    for (x1, y1) in vertices:
+        if (y1 > y) != (y0 > y) and x < x0 + (y - y0) * (x1 - x0) / (y1 - y0):
+            qInside = not qInside
+        (x0, y0) = (x1, y1)
+    return qInside
+
+def distance(x0:float, y0:float, x1:float, y1:float) -> float:
+    ''' Haversine distance in nautical miles between two lon/lat points '''
+    (lon0, lat0, lon1, lat1) = map(math.radians, (x0, y0, x1, y1))
+    a = math.sin((lat1 - lat0) / 2)**2 \
+            + math.cos(lat0) * math.cos(lat1) * math.sin((lon1 - lon0) / 2)**2
+    return 2 * 3440.065 * math.asin(math.sqrt(a)) # Mean earth radius in nautical miles
+
+class Filter(Thread):
+    def __init__(self, args:ArgumentParser) -> None:
+        Thread.__init__(self, "Filter", args)
+        self.__qInput = BoundedQueue("Filter", args)
+        self.__qOutput = set()
+        self.__counts = dict.fromkeys(
+                ("allowed", "denied", "ownShip", "inside", "outside", "recent", "stale"), 0)
+        for key in self.__counts:
+            QueueStats.addGauge("filter" + key[0].upper() + key[1:],
+                    lambda key=key: self.__counts[key])
+
+    @staticmethod
+    def addArgs(parser:ArgumentParser) -> None:
+        grp = parser.add_argument_group(description="Filter related options")
+        grp.add_argument("--filterPolygon", type=str, metavar="lat,lon lat,lon ...",
+                help="Only keep vessels inside this polygon")
+        grp.add_argument("--filterShip", type=int, metavar="MMSI",
+                help="Our own ship's MMSI, its position is the center for --filterRadius")
+        grp.add_argument("--filterRadius", type=float,
+                help="Only keep vessels within this many nautical miles of --filterShip")
+        grp.add_argument("--filterAllow", type=int, action="append", metavar="MMSI",
+                help="Always keep messages from this MMSI")
+        grp.add_argument("--filterDeny", type=int, action="append", metavar="MMSI",
+                help="Always drop messages from this MMSI")
+        grp.add_argument("--filterAge", type=float, default=3600,
+                help="Keep messages without a position if the vessel was inside within this many seconds")
+
+    @staticmethod
+    def qUse(args:ArgumentParser) -> bool:
+        if args.filterPolygon or args.filterRadius or args.filterDeny: return True
+
+    def qActive(self) -> bool:
+        return len(self.__qOutput) # Somebody for me to send stuff to
+
+    def queue(self, q:queue.Queue) -> None:
+        self.__qOutput.add(q)
+
+    def put(self, payload:Message) -> None:
+        self.__qInput.put(payload)
+
+    def __forward(self, payload:Message) -> None:
+        for q in self.__qOutput:
+            q.put(payload)
+
+    def runIt(self): # Called on thread start
+        q = self.__qInput
+        args = self.args
+        counts = self.__counts
+        allow = frozenset(args.filterAllow or ())
+        deny = frozenset(args.filterDeny or ())
+        ship = args.filterShip
+        radius = args.filterRadius if ship is not None else None
+        if args.filterRadius and ship is None:
+            logging.warning("--filterRadius ignored without --filterShip")
+        vertices = mkPolygon(args.filterPolygon) if args.filterPolygon else None
+        if vertices: # Bounding box to skip the polygon test for most outside positions
+            (xMin, xMax) = (min(v[0] for v in vertices), max(v[0] for v in vertices))
+            (yMin, yMax) = (min(v[1] for v in vertices), max(v[1] for v in vertices))
+        qArea = vertices is not None or radius is not None
+        maxAge = args.filterAge
+        shipPos = None # Our own ship's last (lon, lat)
+        inside = OrderedDict() # MMSI -> time last seen inside, least recently seen first
+        logging.info("Starting polygon %s ship %s radius %s allow %s deny %s",
+                vertices, ship, radius, sorted(allow), sorted(deny))
+
+        while True:
+            msg = q.get()
+            q.task_done()
+            mmsi = msg.get("mmsi")
+            if mmsi in deny:
+                counts["denied"] += 1
+                continue
+            if mmsi in allow:
+                counts["allowed"] += 1
+                self.__forward(msg)
+                continue
+            if mmsi is not None and mmsi == ship:
+                if "x" in msg and "y" in msg: shipPos = (msg["x"], msg["y"])
+                counts["ownShip"] += 1
+                self.__forward(msg)
+                continue
+            if not qArea or mmsi is None: # Nothing to filter on
+                self.__forward(msg)
+                continue
+
+            t = msg["t"]
+            while inside: # Prune vessels not seen inside recently, oldest first
+                (key, tSeen) = next(iter(inside.items()))
+                if tSeen > t - maxAge: break
+                inside.popitem(last=False)
+
+            if "x" not in msg or "y" not in msg: # Static/voyage data
+                if mmsi in inside:
+                    counts["recent"] += 1
+                    self.__forward(msg)
+                else:
+                    counts["stale"] += 1
+                continue
+
+            (x, y) = (msg["x"], msg["y"])
+            qInside = False
+            if vertices is not None and xMin <= x <= xMax and yMin <= y <= yMax:
+                qInside = inPolygon(x, y, vertices)
+            if not qInside and radius is not None:
+                # Until our own position is known, keep everything
+                qInside = shipPos is None or distance(shipPos[0], shipPos[1], x, y) <= radius
+
+            if qInside:
+                counts["inside"] += 1
+                inside[mmsi] = t
+                inside.move_to_end(mmsi)
+                self.__forward(msg)
+            else:
+                counts["outside"] += 1
+                inside.pop(mmsi, None) # Left the area, so stop passing its static data
@@ -0,0 +1,39 @@
+#
+# Immutable payloads shared between the threads of the AIS pipeline.
+# A producer builds a payload once and every consumer gets the same object,
+# so no consumer may modify it. A stage that needs changes builds a new one.
+#
+# Oct-2026, Pat Welch, pat@mousebrains.com
+
+from typing import NamedTuple
+
+class Datagram(NamedTuple):
+    ''' A raw datagram or serial read as received by Reader '''
+    t: float # UTC seconds when received
+    addr: str # Sender's IP address, None for serial
+    port: int # Sender's port, None for serial
+    data: bytes
+    src: str = None # Which input, udp:port or the serial device
+
+class Message(dict):
+    ''' Read-only dictionary of a decrypted AIS message '''
+    __slots__ = ()
+
+    def __readOnly(self, *args, **kwargs) -> None:
+        raise TypeError(f"{type(self).__name__} is read-only")
+
+    __setitem__ = __readOnly
+    __delitem__ = __readOnly
+    __ior__ = __readOnly
+    clear = __readOnly
+    pop = __readOnly
+    popitem = __readOnly
+    setdefault = __readOnly
+    update = __readOnly
+
+    def __reduce__(self) -> tuple: # Pickle without going through __setitem__
+        return (type(self), (dict(self),))
+
+    def evolve(self, changes:dict) -> "Message":
+        ''' Copy-on-write, a new Message with changes applied '''
+        return type(self)({**self, **changes})
@@ -0,0 +1,68 @@
+#
+# Frame !AIVDM/!AIVDO sentences out of a datagram buffer and verify their checksums
+# without backtracking regular expressions or per-byte Python loops.
+#
+# Oct-2026, Pat Welch, pat@mousebrains.com
+
+def checksum(body:bytes) -> int:
+    ''' XOR of all the bytes in body, which is at most maxBody bytes '''
+    # Fold the bytes, as one big integer, onto the low byte
+    x = int.from_bytes(body, "little")
+    x ^= x >> 512
+    x ^= x >> 256
+    x ^= x >> 128
+    x ^= x >> 64
+    x ^= x >> 32
+    x ^= x >> 16
+    x ^= x >> 8
+    return x & 0xff
+
+maxBody = 128 # Bytes checksum folds, longer than any legal NMEA sentence
+
+def frames(data:bytes) -> list:
+    '''
+    Find every !AIVD[MO] sentence in data
+    return a list of (body, checksum) where body is between ! and *
+    and checksum is the two hex characters following *, as bytes
+    '''
+    items = []
+    i = data.find(b"!AIVD")
+    while i >= 0:
+        j = data.find(b"*", i)
+        if j < 0: break # Truncated sentence
+        k = data.find(b"!AIVD", i + 1)
+        if 0 <= k < j: # Sentence without a checksum, so skip it
+            i = k
+            continue
+        items.append((data[i+1:j], data[j+1:j+3]))
+        i = k
+    return items
+
+def split(body:bytes, chksum:bytes) -> list:
+    '''
+    Verify the checksum and take the sentence apart into fields
+    field[0] -> AIVD[MO]
+    field[1] -> Total number of fragments, for single part messages, this is 1
+    field[2] -> Fragment number, for single part messages this is 1
+    field[3] -> multipart identification count
+    field[4] -> Radio channel, A or 1 -> 161.975MHz B or 2 -> 162.025MHz
+    field[5] -> data payload
+    field[6] -> number of fill bits
+    raises ValueError if the sentence is not valid
+    '''
+    if len(body) > maxBody:
+        raise ValueError(f"Sentence is too long, {len(body)} > {maxBody}")
+    chk = checksum(body)
+    sentChkSum = int(chksum, 16) if len(chksum) == 2 else None
+    if chk != sentChkSum:
+        raise ValueError(f"Bad checksum, {chk} != {sentChkSum}")
+
+    fields = str(body, "UTF-8").split(",")
+    if len(fields) != 7 or fields[0] not in ("AIVDM", "AIVDO"):
+        raise ValueError("There weren't 7 fields")
+    fields[1] = int(fields[1]) # Number of fragments
+    fields[2] = int(fields[2]) # Fragment number
+    fields[6] = int(fields[6]) # Fill bits
+    if not (0 <= fields[6] <= 5):
+        raise ValueError(f"Fill bits, {fields[6]}, out of range")
+    return fields
@@ -5,19 +5,20 @@
 
 from argparse import ArgumentParser
 from TPWUtils.Thread import Thread
+from AIS.BoundedQueue import BoundedQueue
+from AIS.Message import Datagram
 import logging
-import queue
 import sqlite3
-try:
-    import psycopg3
+try: # See if this system has psycopg installed
+    import psycopg
     qPSQL = True
-except:
+except ImportError:
     qPSQL = False
 
 class Raw2DB(Thread):
     def __init__(self, args:ArgumentParser) -> None:
         Thread.__init__(self, "R2DB", args)
-        self.__queue = queue.Queue()
+        self.__queue = BoundedQueue("R2DB", args, "block") # Lossless archive
 
     @staticmethod
     def addArgs(parser:ArgumentParser) -> None:
@@ -31,10 +32,10 @@ class Raw2DB(Thread):
     @staticmethod
     def qUse(args:ArgumentParser) -> bool:
         if args.r2dbSQLite3: return True
-        return qPSQL and self.args.r2dbPostgreSQL
+        return qPSQL and args.r2dbPostgreSQL
 
-    def put(self, payload:tuple[float, str, int, bytes]) -> None:
-        self.__queue.put(payload)
+    def put(self, batch:tuple[Datagram]) -> None:
+        self.__queue.put(batch)
 
     def runIt(self): # Called on thread start
         args = self.args
@@ -43,7 +44,7 @@ class Raw2DB(Thread):
         logging.info("Starting %s %s", dbname, args.r2dbTable)
         with sqlite3.connect(dbname) \
                 if qSQLite3 else \
-                psycopg3.connect(dbname) \
+                psycopg.connect(dbname=dbname, autocommit=True) \
                 as db:
                     self.__mkTable(db)
                     self.__process(db)
@@ -65,13 +66,19 @@ class Raw2DB(Thread):
     def __process(self, db) -> None:
         tbl = self.args.r2dbTable
         q = self.__queue
-        sql = f"INSERT INTO {tbl} VALUES(?,?,?,?) ON CONFLICT DO NOTHING;"
+        marker = "?" if self.args.r2dbSQLite3 else "%s"
+        sql = f"INSERT INTO {tbl} VALUES({marker},{marker},{marker},{marker})"
+        sql+= " ON CONFLICT DO NOTHING;"
         logging.debug("%s", sql)
         cur = db.cursor()
         while True:
-            payload = q.get()
-            logging.debug("Received %s", payload)
+            batch = q.get()
+            logging.debug("Received %s", batch)
             cur.execute("BEGIN;")
-            cur.execute(sql, payload)
+            if self.args.r2dbSQLite3:
+                rows = [item[:4] for item in batch] # t, ipAddr, port, msg
+            else: # bytes would be stored as bytea's hex text in msg
+                rows = [item[:3] + (str(item[3], "UTF-8", "backslashreplace"),) for item in batch]
+            cur.executemany(sql, rows)
             cur.execute("COMMIT;")
             q.task_done()
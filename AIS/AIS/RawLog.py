@@ -0,0 +1,151 @@
+#
+# Archive raw datagrams into append-only binary segment files,
+# and read them back by time range.
+#
+# Each segment, raw.YYYYmmddTHHMMSS.seg, is a sequence of records:
+#   header <dI4sHB> -> t, data length, IPv4 address, port, source tag length
+#   source tag
+#   data
+# Each segment has a small time index, raw.YYYYmmddTHHMMSS.idx, of <dQ> -> (t, offset)
+# entries written every --rawLogIndex seconds of data.
+#
+# Oct-2026, Pat Welch, pat@mousebrains.com
+
+from argparse import ArgumentParser
+from TPWUtils.Thread import Thread
+from AIS.BoundedQueue import BoundedQueue
+from AIS.Message import Datagram
+from datetime import datetime, timezone
+import bisect
+import glob
+import logging
+import os
+import socket
+import struct
+
+class Raw2Log(Thread):
+    Header = struct.Struct("<dI4sHB") # t, len(data), IPv4, port, len(src)
+    Index = struct.Struct("<dQ") # t, offset
+
+    def __init__(self, args:ArgumentParser) -> None:
+        Thread.__init__(self, "R2LOG", args)
+        self.__queue = BoundedQueue("R2LOG", args, "block") # Lossless archive
+
+    @staticmethod
+    def addArgs(parser:ArgumentParser) -> None:
+        grp = parser.add_argument_group(description="Raw2Log related options")
+        grp.add_argument("--rawLog", type=str, metavar="directory",
+                help="Directory to write raw datagram segment files into")
+        grp.add_argument("--rawLogSize", type=int, default=64 * 1024 * 1024,
+                help="Start a new segment after this many bytes")
+        grp.add_argument("--rawLogIndex", type=float, default=60,
+                help="Seconds of data between time index entries")
+
+    @staticmethod
+    def qUse(args:ArgumentParser) -> bool:
+        if args.rawLog: return True
+
+    def put(self, batch:tuple[Datagram]) -> None:
+        self.__queue.put(batch)
+
+    def __open(self, t:float) -> tuple:
+        # Always start a new segment, a previous one may end in a partial record
+        stem = os.path.join(self.args.rawLog,
+                datetime.fromtimestamp(t, tz=timezone.utc).strftime("raw.%Y%m%dT%H%M%S"))
+        fn = stem
+        cnt = 0
+        while os.path.exists(fn + ".seg"):
+            cnt += 1
+            fn = f"{stem}.{cnt}"
+        logging.info("Opening %s.seg", fn)
+        return (open(fn + ".seg", "xb"), open(fn + ".idx", "xb"))
+
+    def runIt(self): # Called on thread start
+        q = self.__queue
+        args = self.args
+        logging.info("Starting %s size %s index %s",
+                args.rawLog, args.rawLogSize, args.rawLogIndex)
+        os.makedirs(args.rawLog, mode=0o755, exist_ok=True)
+        fp = None # Current segment
+        fpIndex = None # Current segment's time index
+        tIndex = None # Time of the next index entry
+        try:
+            while True:
+                batch = q.get()
+                for (t, addr, port, data, src) in batch:
+                    if fp is None:
+                        (fp, fpIndex) = self.__open(t)
+                        tIndex = t
+                    if t >= tIndex:
+                        fpIndex.write(self.Index.pack(t, fp.tell()))
+                        tIndex = t + args.rawLogIndex
+                    src = bytes(src, "utf-8")[:255] if src else b""
+                    fp.write(self.Header.pack(t, len(data),
+                        socket.inet_aton(addr) if addr else bytes(4),
+                        port if port else 0, len(src)))
+                    fp.write(src)
+                    fp.write(data)
+                fp.flush()
+                fpIndex.flush()
+                q.task_done()
+                if fp.tell() >= args.rawLogSize:
+                    logging.info("Closing %s size %s", fp.name, fp.tell())
+                    fp.close()
+                    fpIndex.close()
+                    fp = None
+        finally:
+            if fp:
+                fp.close()
+                fpIndex.close()
+
+class RawLogReader:
+    ''' Read datagrams back from the segments written by Raw2Log '''
+    def __init__(self, directory:str) -> None:
+        segments = []
+        for fn in glob.glob(os.path.join(directory, "raw.*.seg")):
+            t0 = self.__firstTime(fn)
+            if t0 is not None: segments.append((t0, fn))
+        self.__segments = [(fn, t0) for (t0, fn) in sorted(segments)] # In time order
+
+    @staticmethod
+    def __firstTime(fn:str) -> float:
+        with open(fn, "rb") as fp:
+            hdr = fp.read(Raw2Log.Header.size)
+        return Raw2Log.Header.unpack(hdr)[0] if len(hdr) == Raw2Log.Header.size else None
+
+    @staticmethod
+    def __seek(fn:str, tStart:float) -> int:
+        ''' Offset of the last index entry at or before tStart '''
+        if tStart is None: return 0
+        with open(os.path.splitext(fn)[0] + ".idx", "rb") as fp:
+            buffer = fp.read()
+        n = len(buffer) // Raw2Log.Index.size
+        entries = [Raw2Log.Index.unpack_from(buffer, i * Raw2Log.Index.size) for i in range(n)]
+        index = bisect.bisect_right([item[0] for item in entries], tStart) - 1
+        return entries[index][1] if index >= 0 else 0
+
+    def read(self, tStart:float=None, tEnd:float=None):
+        ''' Yield Datagrams with tStart <= t < tEnd in time order '''
+        hdr = Raw2Log.Header
+        segments = self.__segments
+        for i in range(len(segments)):
+            (fn, t0) = segments[i]
+            if tEnd is not None and t0 >= tEnd: return
+            if tStart is not None and i + 1 < len(segments) and segments[i+1][1] <= tStart:
+                continue # Everything in this segment is before tStart
+            with open(fn, "rb") as fp:
+                fp.seek(self.__seek(fn, tStart))
+                while True:
+                    buffer = fp.read(hdr.size)
+                    if len(buffer) != hdr.size: break # EOF or partial record
+                    (t, sz, addr, port, szSrc) = hdr.unpack(buffer)
+                    src = fp.read(szSrc)
+                    data = fp.read(sz)
+                    if len(data) != sz: break # Partial record
+                    if tStart is not None and t < tStart: continue
+                    if tEnd is not None and t >= tEnd: return
+                    yield Datagram(t,
+                            socket.inet_ntoa(addr) if any(addr) else None,
+                            port if port else None,
+                            data,
+                            str(src, "utf-8") if src else None)
@@ -1,7 +1,7 @@
 #! /usr/bin/env python3
 #
-# Listen to a UDP port or serial device for datagrams, 
-# then forward copies to various consumers.
+# Listen to a set of UDP ports and serial devices for datagrams,
+# then forward copies, tagged with their source, to various consumers.
 # The current consumers include:
 #  - Write each raw datagram to a database.
 #  - Split each datagram into raw NEMA sentences.
@@ -27,17 +27,19 @@
 
 from argparse import ArgumentParser
 from TPWUtils.Thread import Thread
+from AIS.Message import Datagram
 import sys
 import queue
 import time
 import socket
 import logging
-import select
+import selectors
+import contextlib
 import serial
 
 class Reader(Thread):
-    ''' 
-    Read from either a UDP port or a serial device.
+    '''
+    Read from any number of UDP ports and serial devices in one thread.
     Read in the datagrams then forward them to a set of queues
     '''
 
@@ -71,10 +73,12 @@ class Reader(Thread):
         # be multiple NEMA sentences in a datagram for multipart payloads.
         # so take a guess at 20 * NEMA+3
         grp.add_argument("--udpSize", type=int, default=20*85, help="Datagram size")
-        grp = parser.add_mutually_exclusive_group(required=True)
-        grp.add_argument("--inputUDP", type=int, metavar="8982", help='UDP port to listen on')
-        grp.add_argument("--inputSerial", type=str, metavar="/dev/tty-usb0", 
-                help='Serial device to listen to')
+        grp.add_argument("--udpBatch", type=int, default=256,
+                help="Maximum number of datagrams to read per wakeup")
+        grp.add_argument("--inputUDP", type=int, metavar="8982", action="append",
+                help='UDP port to listen on, may be repeated')
+        grp.add_argument("--inputSerial", type=str, metavar="/dev/tty-usb0", action="append",
+                help='Serial device to listen to, may be repeated')
         grp = parser.add_argument_group(description="Input serial related options")
         grp.add_argument("--serialBaudrate", type=int, default=115200, help="Serial port baudrate")
         grp.add_argument("--serialBytesize", type=int, default=8, 
@@ -87,55 +91,81 @@ class Reader(Thread):
     def queue(self, q:queue.Queue) -> None:
         self.__queues.add(q)
 
+    @staticmethod
+    def qUse(args:ArgumentParser) -> bool:
+        return bool(args.inputUDP or args.inputSerial)
+
     def runIt(self) -> None:
         '''Called on thread start '''
-        self.__runUDP() if self.args.inputUDP else self.__runSerial()
+        args = self.args
+        with contextlib.ExitStack() as stack, selectors.DefaultSelector() as sel:
+            for port in args.inputUDP or []:
+                s = stack.enter_context(self.__openUDP(port))
+                sel.register(s, selectors.EVENT_READ, (self.__readUDP, f"udp:{port}"))
+            for device in args.inputSerial or []:
+                s = stack.enter_context(self.__openSerial(device))
+                sel.register(s, selectors.EVENT_READ, (self.__readSerial, device))
+            if not sel.get_map():
+                raise Exception("No --inputUDP or --inputSerial specified")
 
-    def __forward(self, t:float, addr:str, port:int, data:bytes) -> None:
-        payload = (t, addr, port, data)
-        logging.debug("Forwarding %s", payload)
-        for q in self.__queues:
-            q.put(payload)
+            while True:
+                for (key, mask) in sel.select():
+                    (reader, src) = key.data
+                    reader(key.fileobj, src)
 
-    def __runUDP(self) -> None:
-        args = self.args
-        port = args.inputUDP
-        sz = args.udpSize
-        logging.info("Starting port=%s size=%s", port, sz)
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
-            logging.debug("Opened UDP socket")
-            s.bind(('', port))
-            logging.debug('Bound to port %s', port)
-            while True: # Read datagrams
-                (data, senderAddr) = s.recvfrom(sz)
+    def __forward(self, batch:tuple[Datagram]) -> None:
+        logging.debug("Forwarding %s", batch)
+        for q in self.__queues: # The batch is shared by all consumers
+            q.put(batch)
+
+    def __openUDP(self, port:int) -> socket.socket:
+        logging.info("Starting port=%s size=%s", port, self.args.udpSize)
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        logging.debug("Opened UDP socket")
+        s.bind(('', port))
+        logging.debug('Bound to port %s', port)
+        return s
+
+    def __readUDP(self, s:socket.socket, src:str) -> None:
+        # Drain everything waiting on the socket, so there is one put per consumer
+        # per wakeup rather than per datagram. Each datagram keeps its own timestamp,
+        # since identical datagrams are distinguished downstream by (t, msg).
+        sz = self.args.udpSize
+        items = []
+        try: # The selector said the first recvfrom will not block
+            for i in range(self.args.udpBatch):
+                (data, (ipAddr, port)) = s.recvfrom(sz, socket.MSG_DONTWAIT if items else 0)
                 t = time.time() # Timestamp just after the packet was received
-                (ipAddr, port) = senderAddr
-                self.__forward(t, ipAddr, port, data)
+                items.append(Datagram(t, ipAddr, port, data, src))
+        except BlockingIOError:
+            pass
+        self.__forward(tuple(items))
 
-    def __runSerial(self) -> None:
+    def __openSerial(self, device:str) -> serial.Serial:
         args = self.args
-        device = args.inputSerial
         logging.info("Starting %s baud %s size %s parity %s stop %s", 
                 device, args.serialBaudrate, args.serialBytesize, args.serialParity,
                 args.serialStopbits)
-        with serial.Serial(
+        s = serial.Serial(
                 port=device,
                 timeout=0, # Non-blocking
                 baudrate=args.serialBaudrate,
                 bytesize=self.__Bytesizes[args.serialBytesize],
                 parity=self.__Parity[args.serialParity],
                 stopbits=self.__Stopbits[args.serialStopbits],
-                ) as s:
-            logging.debug("Reading from %s", s)
-            while s.is_open:
-                (rlist, wlist, xlist) = select.select([s], [], [])
-                t = time.time() # Time data became available
-                try:
-                    data = s.read(65536) # Read everything that is waiting
-                except Exception as e:
-                    dt = 1.1
-                    logging.error("Exception while reading, waiting %s seconds", dt)
-                    time.sleep(dt)
-                    raise e
-                self.__forward(t, None, None, data)
-        raise Exception(f"EOF while reading from {device}") # Should not be reached
+                )
+        logging.debug("Reading from %s", s)
+        return s
+
+    def __readSerial(self, s:serial.Serial, src:str) -> None:
+        t = time.time() # Time data became available
+        if not s.is_open:
+            raise Exception(f"EOF while reading from {src}")
+        try:
+            data = s.read(65536) # Read everything that is waiting
+        except Exception as e:
+            dt = 1.1
+            logging.error("Exception while reading %s, waiting %s seconds", src, dt)
+            time.sleep(dt)
+            raise e
+        self.__forward((Datagram(t, None, None, data, src),))
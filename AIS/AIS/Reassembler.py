@@ -0,0 +1,72 @@
+#
+# Reassemble multipart AIS payloads from split NEMA sentences
+#
+# Fragments are keyed by (input source, radio channel, sequence id, fragment count),
+# so messages from different receivers or on the two channels do not collide.
+# Pending messages are kept in first seen order, so aging out stale ones
+# only looks at the oldest entries.
+#
+# Oct-2026, Pat Welch, pat@mousebrains.com
+
+import logging
+from collections import OrderedDict
+
+class Reassembler:
+    def __init__(self, maxAge:float=60) -> None:
+        self.__maxAge = maxAge # Seconds to wait for all the fragments
+        self.__partials = OrderedDict() # key -> {age, payloads, fillBits}, oldest first
+        self.nCompleted = 0 # Multipart messages reassembled
+        self.nExpired = 0 # Multipart messages aged out before all fragments arrived
+        self.nCollided = 0 # Multipart messages replaced by a new one with the same key
+
+    def __len__(self) -> int:
+        return len(self.__partials)
+
+    def __age(self, t:float) -> None: # Maximum age to avoid memory leaks
+        info = self.__partials
+        t0 = t - self.__maxAge
+        while info:
+            (ident, item) = next(iter(info.items()))
+            if item["age"] > t0: break
+            logging.warning("Aged out %s", ident)
+            info.popitem(last=False)
+            self.nExpired += 1
+
+    def add(self, t:float, fields:list, src:str=None) -> list:
+        '''
+        fields are from NMEA.split, src is which input they came from
+        returns fields with the reassembled payload and fill bits,
+        or None if more fragments are needed
+        '''
+        if fields[1] == 1: return fields # No need to Accumulate
+
+        self.__age(t)
+
+        info = self.__partials # previous information on partial messages
+        ident = (src, fields[4], fields[3], fields[1]) # source, channel, sequence id, fragments
+
+        item = info.get(ident)
+        if item is not None and fields[2] in item["payloads"]: # Sequence id reused
+            logging.warning("Collision for %s", ident)
+            del info[ident]
+            self.nCollided += 1
+            item = None
+
+        if item is None:  # First time this ident has been seen
+            item = {"payloads": {}, "fillBits": 0, "age": t}
+            info[ident] = item
+
+        item["payloads"][fields[2]] = fields[5] # Accumulate payloads
+
+        if fields[1] == fields[2]: # Number of fill bits on last segment
+            item["fillBits"] = fields[6]
+
+        if len(item["payloads"]) != fields[1]: return None # Need to accumulate some more
+
+        # Assemble parts in correct order
+        payloads = item["payloads"]
+        fields[5] = "".join(payloads[key] for key in sorted(payloads))
+        fields[6] = item["fillBits"]
+        del info[ident]
+        self.nCompleted += 1
+        return fields
@@ -0,0 +1,155 @@
+#! /usr/bin/env python3
+#
+# Reprocess raw datagrams stored by Raw2DB,
+# decrypting the AIS payloads across a pool of processes,
+# then write the results, in time order, via the AIS2DB and AIS2CSV sinks.
+#
+# - libais
+# - sqlite3
+# - psycopg3
+#
+# Oct-2026, Pat Welch, pat@mousebrains.com
+
+from argparse import ArgumentParser
+from TPWUtils import Logger
+from AIS import NMEA
+from AIS.Reassembler import Reassembler
+from AIS.Decrypter import decode
+from AIS.Message import Message
+from AIS.AIS2DB import AIS2DB
+from AIS.AIS2CSV import AIS2CSV
+from AIS.BoundedQueue import BoundedQueue
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import logging
+import os
+import time
+import sqlite3
+try: # See if this system has psycopg installed
+    import psycopg
+    qPSQL = True
+except ImportError:
+    qPSQL = False
+
+def decodeBatch(items:list) -> list:
+    ''' Run in a worker process, items is a list of (t, payload, fillBits) '''
+    return [decode(*item) for item in items]
+
+def mkTime(t:str) -> float:
+    if t is None: return None
+    t = datetime.fromisoformat(t)
+    if t.tzinfo is None: t = t.replace(tzinfo=timezone.utc)
+    return t.timestamp()
+
+def fetchChunks(db, args:ArgumentParser):
+    ''' Yield chunks of (t, msg) rows in time order, using keyset pagination on (t,msg) '''
+    marker = "?" if args.sqlite3 else "%s"
+    tStart = mkTime(args.start)
+    tEnd = mkTime(args.end)
+    prev = None
+    while True:
+        criteria = []
+        values = []
+        if prev is not None:
+            criteria.append(f"(t,msg)>({marker},{marker})")
+            values.extend(prev)
+        elif tStart is not None:
+            criteria.append(f"t>={marker}")
+            values.append(tStart)
+        if tEnd is not None:
+            criteria.append(f"t<{marker}")
+            values.append(tEnd)
+        sql = f"SELECT t,msg FROM {args.table}"
+        if criteria: sql+= " WHERE " + " AND ".join(criteria)
+        sql+= f" ORDER BY t,msg LIMIT {args.chunk};"
+        cur = db.cursor()
+        cur.execute(sql, values)
+        rows = cur.fetchall()
+        if not rows: return
+        yield rows
+        prev = rows[-1]
+
+def reassemble(rows:list, partials:Reassembler) -> list:
+    ''' Frame, checksum and reassemble in this process, since multipart state spans chunks '''
+    items = []
+    for (t, data) in rows:
+        if isinstance(data, str): data = bytes(data, "UTF-8")
+        for (body, chksum) in NMEA.frames(data):
+            try:
+                fields = partials.add(t, NMEA.split(body, chksum))
+            except ValueError:
+                continue
+            if fields is not None:
+                items.append((t, fields[5], fields[6]))
+    return items
+
+def process(db, args:ArgumentParser, sinks:list) -> None:
+    partials = Reassembler()
+    nJobs = args.jobs
+    nRows = 0
+    nMsgs = 0
+    t0 = time.time()
+    with ProcessPoolExecutor(max_workers=nJobs) as pool:
+        for rows in fetchChunks(db, args):
+            tc = time.time()
+            items = reassemble(rows, partials)
+            n = max(1, len(items) // (4 * nJobs)) # Items per worker call
+            batches = [items[i:i+n] for i in range(0, len(items), n)]
+            cnt = 0
+            for infos in pool.map(decodeBatch, batches): # map preserves the order
+                for info in infos:
+                    if info is None: continue
+                    msg = Message(info)
+                    for sink in sinks: sink.put(msg)
+                    cnt += 1
+            nRows += len(rows)
+            nMsgs += cnt
+            dt = time.time() - tc
+            logging.info("Chunk %s rows %s messages, %.0f messages/second",
+                    len(rows), cnt, cnt / dt if dt > 0 else 0)
+    for sink in sinks: sink.drain()
+    dt = time.time() - t0
+    logging.info("Total %s rows %s messages in %.1f seconds, %.0f messages/second",
+            nRows, nMsgs, dt, nMsgs / dt if dt > 0 else 0)
+    logging.info("Multipart completed %s expired %s collided %s pending %s",
+            partials.nCompleted, partials.nExpired, partials.nCollided, len(partials))
+
+# Construct command line arguments
+parser = ArgumentParser()
+Logger.addArgs(parser)
+grp = parser.add_argument_group(description="Backfill related options")
+grp.add_argument("--table", type=str, default="raw", help="Raw2DB table name to read data from")
+grp.add_argument("--start", type=str, help="UTC time to start at, YYYY-MM-DD HH:MM:SS")
+grp.add_argument("--end", type=str, help="UTC time to stop before, YYYY-MM-DD HH:MM:SS")
+grp.add_argument("--chunk", type=int, default=50000, help="Number of rows to read at a time")
+grp.add_argument("--jobs", type=int, default=os.cpu_count(), help="Number of decoding processes")
+grp = parser.add_mutually_exclusive_group(required=True)
+grp.add_argument("--sqlite3", type=str, help="SQLite3 database filename")
+if qPSQL:
+    grp.add_argument("--postgresql", type=str, help="PostgreSQL database name")
+AIS2DB.addArgs(parser)
+AIS2CSV.addArgs(parser)
+BoundedQueue.addArgs(parser)
+parser.set_defaults(queuePolicy="block") # Never drop messages while backfilling
+args = parser.parse_args()
+if not AIS2DB.qUse(args) and not AIS2CSV.qUse(args):
+    parser.error("No output specified, use --ais2dbSQLite3, --ais2dbPostgreSQL, and/or --csv")
+
+Logger.mkLogger(args, fmt="%(asctime)s %(levelname)s: %(message)s")
+logging.info("Args %s", args)
+
+try:
+    sinks = []
+    for sink in (AIS2DB, AIS2CSV):
+        if not sink.qUse(args): continue
+        thrd = sink(args)
+        thrd.start()
+        sinks.append(thrd)
+
+    with sqlite3.connect(args.sqlite3) \
+            if args.sqlite3 else \
+            psycopg.connect(dbname=args.postgresql) \
+            as db:
+        process(db, args, sinks)
+except:
+    logging.exception("Unexpected exception while backfilling")
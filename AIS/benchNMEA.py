@@ -0,0 +1,85 @@
+#! /usr/bin/env python3
+#
+# Microbenchmark for framing and checksumming AIVDM sentences,
+# the original per-line regular expression and XOR loop versus AIS.NMEA
+#
+# Oct-2026, Pat Welch, pat@mousebrains.com
+
+from argparse import ArgumentParser
+from AIS import NMEA
+import random
+import re
+import sqlite3
+import time
+
+def mkSentence(nParts:int=1, part:int=1, ident:str="", channel:str="A") -> bytes:
+    armor = "0123456789:;<=>?@ABCDEFGHIJKLMNOPQRSTUVW`abcdefghijklmnopqrstuvw"
+    payload = "".join(random.choices(armor, k=28 if nParts == 1 else 60))
+    body = bytes(f"AIVDM,{nParts},{part},{ident},{channel},{payload},0", "UTF-8")
+    return b"!" + body + b"*" + bytes(f"{NMEA.checksum(body):02X}", "UTF-8") + b"\r\n"
+
+def mkDatagrams(n:int) -> list:
+    items = []
+    for i in range(n):
+        if random.random() < 0.2: # Multipart messages arrive in one datagram
+            ident = str(i % 10)
+            items.append(mkSentence(2, 1, ident) + mkSentence(2, 2, ident))
+        else:
+            items.append(mkSentence())
+    return items
+
+def loadDatagrams(fn:str, table:str, n:int) -> list:
+    with sqlite3.connect(fn) as db:
+        sql = f"SELECT msg FROM {table} ORDER BY t LIMIT ?;"
+        return [row[0] if isinstance(row[0], bytes) else bytes(row[0], "UTF-8")
+                for row in db.execute(sql, (n,))]
+
+reNEMA = re.compile(rb".*!(AIVD[MO],\d+,\d+,\d?,\w?,.*,[0-5])[*]([0-9A-Za-z]{2})\s*")
+
+def original(datagrams:list) -> int:
+    cnt = 0
+    for data in datagrams:
+        for sentence in data.strip().split(b"\n"):
+            matches = reNEMA.match(sentence)
+            if not matches: continue
+            chksum = 0
+            for c in matches[1]: chksum ^= c
+            if chksum != int(str(matches[2], "UTF-8"), 16): continue
+            fields = str(matches[1], "UTF-8").split(",")
+            if len(fields) != 7: continue
+            fields[1] = int(fields[1])
+            fields[2] = int(fields[2])
+            fields[6] = int(fields[6])
+            cnt += 1
+    return cnt
+
+def framed(datagrams:list) -> int:
+    cnt = 0
+    for data in datagrams:
+        for (body, chksum) in NMEA.frames(data):
+            try:
+                NMEA.split(body, chksum)
+                cnt += 1
+            except ValueError:
+                pass
+    return cnt
+
+parser = ArgumentParser()
+parser.add_argument("--n", type=int, default=100000, help="Number of datagrams")
+parser.add_argument("--repeat", type=int, default=5, help="Number of timing repeats")
+parser.add_argument("--sqlite3", type=str, help="Raw2DB database to take datagrams from")
+parser.add_argument("--table", type=str, default="raw", help="Raw2DB table name")
+args = parser.parse_args()
+
+random.seed(12345)
+datagrams = loadDatagrams(args.sqlite3, args.table, args.n) if args.sqlite3 \
+        else mkDatagrams(args.n)
+
+for func in (original, framed):
+    best = None
+    for i in range(args.repeat):
+        t0 = time.perf_counter()
+        cnt = func(datagrams)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    print(f"{func.__name__:>10s} {cnt} sentences {cnt/best:,.0f} sentences/second")
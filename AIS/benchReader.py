@@ -0,0 +1,94 @@
+#! /usr/bin/env python3
+#
+# Benchmark receiving NMEA datagrams one recvfrom/timestamp/queue put at a time
+# versus draining the socket per wakeup and handing a batch to the next stage,
+# which is what AIS/Reader.py and Thompson/udpProcess.py do.
+#
+# Oct-2026, Pat Welch, pat@mousebrains.com
+
+from argparse import ArgumentParser
+import queue
+import select
+import socket
+import threading
+import time
+
+sentence = b"!AIVDM,1,1,,A,13u?etPv2;0n:dDPwUM1U1Cb069D,0*5A\r\n"
+
+def sender(addr:tuple, n:int, rate:float, burst:int) -> None:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        t0 = time.monotonic()
+        for i in range(n):
+            if rate > 0 and not i % burst: # Back to back within a burst
+                dt = t0 + i / rate - time.monotonic()
+                if dt > 0: time.sleep(dt)
+            s.sendto(sentence, addr)
+
+def consumer(q:queue.Queue, counts:list) -> None:
+    while True:
+        item = q.get()
+        if item is None: return
+        counts[0] += len(item) if isinstance(item, list) else 1
+
+def single(s:socket.socket, q:queue.Queue, nBatch:int) -> int:
+    (data, addr) = s.recvfrom(2048)
+    q.put((time.time(), addr, data))
+    return 1
+
+def batch(s:socket.socket, q:queue.Queue, nBatch:int) -> int:
+    items = []
+    try:
+        for i in range(nBatch): # Each datagram gets its own timestamp
+            (data, addr) = s.recvfrom(2048, socket.MSG_DONTWAIT if items else 0)
+            items.append((time.time(), addr, data))
+    except BlockingIOError:
+        pass
+    q.put(items)
+    return len(items)
+
+def run(func, args:ArgumentParser) -> None:
+    q = queue.Queue()
+    counts = [0]
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        s.bind(("127.0.0.1", 0))
+        thrdC = threading.Thread(target=consumer, args=(q, counts), daemon=True)
+        thrdS = threading.Thread(target=sender, args=(s.getsockname(), args.n, args.rate, max(args.burst, 1)),
+                daemon=True)
+        thrdC.start()
+        c0 = time.process_time()
+        t0 = time.perf_counter()
+        thrdS.start()
+        nRecv = 0
+        nWakeups = 0
+        t1 = t0
+        while nRecv < args.n:
+            (rlist, wlist, xlist) = select.select([s], [], [], 1)
+            if not rlist: break # Some datagrams were dropped
+            nRecv += func(s, q, args.batch)
+            nWakeups += 1
+            t1 = time.perf_counter()
+        q.put(None)
+        thrdC.join()
+        cpu = time.process_time() - c0
+    dt = t1 - t0
+    print(f"{func.__name__:>6s} received {nRecv}/{args.n} in {nWakeups} wakeups,",
+            f"{nRecv/dt:,.0f} datagrams/second,",
+            f"{1e6 * cpu / max(nRecv, 1):.1f} CPU usec/datagram")
+
+parser = ArgumentParser()
+parser.add_argument("--n", type=int, default=100000, help="Number of datagrams to send")
+parser.add_argument("--feedRate", type=float, default=200,
+        help="Nominal NMEA feed rate in datagrams/second")
+parser.add_argument("--multiplier", type=float, default=10,
+        help="Send at this multiple of --feedRate, 0 sends as fast as possible")
+parser.add_argument("--burst", type=int, default=1,
+        help="Datagrams sent back to back, at the same average rate, like several receivers")
+parser.add_argument("--batch", type=int, default=256, help="Maximum datagrams per wakeup")
+args = parser.parse_args()
+args.rate = args.feedRate * args.multiplier
+
+print(f"Sending {args.n} datagrams at {args.rate if args.rate > 0 else 'max'} datagrams/second",
+        f"in bursts of {args.burst}")
+for func in (single, batch):
+    run(func, args)
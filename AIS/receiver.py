@@ -1,7 +1,7 @@
 #! /usr/bin/env python3
 #
-# Listen to a UDP port or serial device for datagrams, 
-# then forward copies to various consumers.
+# Listen to a set of UDP ports and serial devices for datagrams,
+# then forward copies to various consumers through a single pipeline.
 # The current consumers include:
 #  - Write each raw datagram to a database.
 #  - Split each datagram into raw NEMA sentences.
@@ -11,6 +11,7 @@
 #       For each valid NEMA sentence the following are options:
 #       --- Write each split validated NEMA sentence to a database.
 #       --- Build AIS payloads for multipart messages and then decrypt them.
+#           Optionally drop messages for vessels outside our operating area.
 #           For each decrypted AIS message the following are options:
 #           ---- Write the full AIS payload to a database
 #           ---- Write the decrypted AIS message in JSON format to a database.
@@ -30,11 +31,14 @@ from TPWUtils import Logger
 from TPWUtils.Thread import Thread
 from AIS.Reader import Reader
 from AIS.Raw2DB import Raw2DB
+from AIS.RawLog import Raw2Log
 from AIS.Decrypter import Decrypter
+from AIS.Filter import Filter
 from AIS.AIS2DB import AIS2DB
 from AIS.AIS2UDP import AIS2UDP
 from AIS.AIS2CSV import AIS2CSV
 from AIS.Accumulator import Accumulator
+from AIS.BoundedQueue import BoundedQueue, QueueStats
 import logging
 
 # Construct command line arguments
@@ -42,13 +46,19 @@ parser = ArgumentParser()
 Logger.addArgs(parser)
 Reader.addArgs(parser)
 Raw2DB.addArgs(parser)
+Raw2Log.addArgs(parser)
 Decrypter.addArgs(parser)
+Filter.addArgs(parser)
 AIS2DB.addArgs(parser)
 AIS2UDP.addArgs(parser)
 AIS2CSV.addArgs(parser)
 Accumulator.addArgs(parser)
+BoundedQueue.addArgs(parser)
 args = parser.parse_args()
 
+if not Reader.qUse(args):
+    parser.error("At least one --inputUDP or --inputSerial must be specified")
+
 Logger.mkLogger(args) # Initialize the root level logger
 logging.info("Args %s", args)
 
@@ -56,22 +66,31 @@ try:
     rdr = Reader(args)
     decrypt = Decrypter(args)
     accumulator = Accumulator(args)
+    filt = Filter(args) if Filter.qUse(args) else None
+    decoded = filt if filt else decrypt # Where decoded messages come from
 
     for item in (
-            (AIS2DB, decrypt), 
+            (AIS2DB, decoded), 
             (AIS2UDP, accumulator),
-            (AIS2CSV, decrypt),
-            (Raw2DB, rdr)):
+            (AIS2CSV, decoded),
+            (Raw2DB, rdr),
+            (Raw2Log, rdr)):
         if not item[0].qUse(args): continue
         thrd = item[0](args)
         item[1].queue(thrd)
         thrd.start()
 
     if accumulator.qUse():
-        decrypt.queue(accumulator)
+        decoded.queue(accumulator)
         accumulator.start()
     else:
         accumulator = None # Free up resources
+
+    if filt and filt.qActive():
+        decrypt.queue(filt)
+        filt.start()
+    else:
+        filt = None # Free up resources
         
     if decrypt.qUse():
         rdr.queue(decrypt)
@@ -79,6 +98,9 @@ try:
     else:
         decrypt = None # Free up resources
 
+    if QueueStats.qUse(args):
+        QueueStats(args).start()
+
     rdr.start() # Start the reader thread last
 
     Thread.waitForException() # This will only raise an exception from a thread
@@ -1,7 +1,10 @@
 #! /usr/bin/env python3
 #
-# Read AIS records from a database, 
-# then spit them out to either a UDP port or a PseudoTTY serial device
+# Read AIS records from a database or Raw2Log segment files,
+# then spit them out to any number of UDP ports and/or a PseudoTTY serial device
+#
+# Sends are scheduled against a monotonic clock, so there is no cumulative drift,
+# and --rate 0 sends as fast as possible for load testing.
 #
 # - sqlite3
 # - psycopg3
@@ -10,11 +13,15 @@
 
 from argparse import ArgumentParser
 from TPWUtils import Logger
+from AIS.RawLog import RawLogReader
+from datetime import datetime, timezone
 import logging
 import time
 import socket
 import pty # PsuedoTTY
 import os
+import re
+import itertools
 import sqlite3
 try: # See if this system has psycopg installed
     import psycopg
@@ -22,87 +29,142 @@ try: # See if this system has psycopg installed
 except:
     qPSQL = False
 
-def process(cur, args:ArgumentParser, sql, sock:socket.socket, master, addr:tuple) -> None:
-    tPrev = None
-    tSent = None
+def mkTime(t:str) -> float:
+    if t is None: return None
+    t = datetime.fromisoformat(t)
+    if t.tzinfo is None: t = t.replace(tzinfo=timezone.utc)
+    return t.timestamp()
+
+def mkTargets(args:ArgumentParser) -> list:
+    targets = []
+    if args.port: targets.append((args.address, args.port))
+    for item in args.target or []:
+        matches = re.match(r"^(.*):(\d+)$", item)
+        if matches is None:
+            raise Exception(f"Invalid formatted --target option, {item}")
+        info = socket.getaddrinfo(matches[1], int(matches[2]),
+                family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        targets.append(info[0][-1]) # (addr,port) pair
+    return targets
+
+def process(rows, args:ArgumentParser, sock:socket.socket, targets:list, master) -> int:
+    rate = args.rate
+    tFirst = None # Time of the first row
+    t0 = None # Monotonic time the first row was sent
     cnt = 0
-    for row in cur.execute(sql):
-        (t, data) = row
-        if tPrev:
-            dt = (t - tPrev) / args.rate - (time.time() - tSent) # How long to sleep
+    for row in rows:
+        (t, data) = row # (t, msg)
+        if isinstance(data, str): data = bytes(data, "UTF-8")
+        if rate > 0:
+            if tFirst is None:
+                tFirst = t
+                t0 = time.monotonic()
+            dt = t0 + (t - tFirst) / rate - time.monotonic() # Until this row is due
             if dt > 0: # Sleep for a bit
                 logging.debug("Sleeping for %s seconds between messages", dt)
                 time.sleep(dt)
         logging.debug("Sending %s", data)
-        if sock:
+        for addr in targets:
             sock.sendto(data, addr)
-        else: # psuedotty
+        if master is not None: # psuedotty
             os.write(master, data)
-        tSent = time.time()
-        tPrev = t
+        cnt += 1
+    return cnt
+
+def dbRows(db, args:ArgumentParser):
+    marker = "?" if args.sqlite3 else "%s"
+    criteria = []
+    values = []
+    if args.start:
+        criteria.append(f"t>={marker}")
+        values.append(mkTime(args.start))
+    if args.end:
+        criteria.append(f"t<{marker}")
+        values.append(mkTime(args.end))
+    sql = f"SELECT t,msg FROM {args.table}"
+    if criteria: sql+= " WHERE " + " AND ".join(criteria) # Range scan on the t index
+    sql+= " ORDER BY t"
+    if args.count:
+        sql+= f" LIMIT {args.count}"
+    elif args.skip and args.sqlite3: # SQLite only allows OFFSET after a LIMIT
+        sql+= " LIMIT -1"
+    if args.skip:  sql+= f" OFFSET {args.skip}"
+    sql+= ";"
+    logging.info("SQL %s %s", sql, values)
+    cur = db.cursor()
+    cur.execute(sql, values)
+    return cur
 
 # Construct command line arguments
 parser = ArgumentParser()
 Logger.addArgs(parser)
 grp = parser.add_argument_group(description="Replay related options")
 grp.add_argument("--rate", type=float, default=1,
-        help="Replay speed up factor compared to what is in the database")
+        help="Replay speed up factor compared to what is in the database, 0 is as fast as possible")
 grp.add_argument("--table", type=str, default="Raw", help="Database table name to read data from")
+grp.add_argument("--start", type=str, help="UTC time to start replaying at, YYYY-MM-DD HH:MM:SS")
+grp.add_argument("--end", type=str, help="UTC time to stop replaying before, YYYY-MM-DD HH:MM:SS")
 grp.add_argument("--count", type=int, help="Number of records to replay")
 grp.add_argument("--skip", type=int, help="Number of rows to skip")
 grp.add_argument("--delay", type=float,
         help="Number of seconds to delay before sending the first record")
 grp.add_argument("--repeat", type=int, default=1, help="Repeat rows sent this many times")
-grp = parser.add_mutually_exclusive_group(required=True)
+grp = parser.add_argument_group(description="Output related options, any combination")
 grp.add_argument("--port", type=int, help="UDP port number to send datagrams to")
+grp.add_argument("--target", type=str, action="append", metavar="host:port",
+        help="Additional UDP host:port to send datagrams to")
 grp.add_argument("--serial", action="store_true", help="Send messages via a pseudoTTY device")
 grp = parser.add_argument_group(description="UDP related options")
 grp.add_argument("--address", type=str, default="127.0.0.1",
         help="IP address to send UDP datagrams to")
 grp = parser.add_mutually_exclusive_group(required=True)
 grp.add_argument("--sqlite3", type=str, help="SQLite3 database filename")
+grp.add_argument("--rawLog", type=str, help="Raw2Log segment directory")
 if qPSQL:
     grp.add_argument("--postgresql", type=str, help="PostgreSQL database name")
 args = parser.parse_args()
 
+if not args.port and not args.target and not args.serial:
+    parser.error("Specify at least one of --port, --target, or --serial")
+
 # Initialize the root level logger
-Logger.mkLogger(args, fmt="%(asctime)s %(levelname)s: %(message)s") 
+Logger.mkLogger(args, fmt="%(asctime)s %(levelname)s: %(message)s")
 logging.info("Args %s", args)
 
 if not qPSQL:
     logging.debug("psycopg3 was not found")
 
+master = None
 if args.serial: # Send via a PsuedoTTY device
-    sock = None
-    addr = None
     (master, slave) = pty.openpty() # Create a psuedoTTY device pair
     logging.info("Serial device name %s", os.ttyname(slave))
     print("Sending to serial device", os.ttyname(slave))
     if not args.delay or (args.delay < 1): args.delay = 10 # Wait 10 seconds
-else: # send via UDP datagrams
-    master = None
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) # Internet/UDP
-    addr = (args.address, args.port)
+
+targets = mkTargets(args) # UDP (addr,port) pairs
+sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) if targets else None # Internet/UDP
+logging.info("Targets %s", targets)
 
 if args.delay is not None and args.delay > 0:
     logging.info("Sleeping for %s seconds", args.delay)
     time.sleep(args.delay)
 
-if args.sqlite3 and args.skip and not args.count:
-    parser.error("For --sqlite3 you must specify --count when you specify --skip")
-
-sql = f"SELECT t,msg FROM {args.table} ORDER BY t"
-if args.count: sql+= f" LIMIT {args.count}"
-if args.skip:  sql+= f" OFFSET {args.skip}"
-sql+= ";"
-
-logging.info("SQL %s", sql)
-
 # Open a database connection and then send rows as needed
 
-for repeat in range(min(args.repeat, 1)):
-    with sqlite3.connect(args.sqlite3) \
-            if args.sqlite3 else \
-            psycopg3.connect(args.postgresql) \
-            as db:
-        process(db.cursor(), args, sql, sock, master, addr)
+for repeat in range(max(args.repeat, 1)):
+    t0 = time.monotonic()
+    if args.rawLog:
+        rows = RawLogReader(args.rawLog).read(mkTime(args.start), mkTime(args.end))
+        rows = ((d.t, d.data) for d in rows) # Same (t, msg) shape as the database rows
+        if args.skip: rows = itertools.islice(rows, args.skip, None)
+        if args.count: rows = itertools.islice(rows, args.count)
+        cnt = process(rows, args, sock, targets, master)
+    else:
+        with sqlite3.connect(args.sqlite3) \
+                if args.sqlite3 else \
+                psycopg.connect(args.postgresql) \
+                as db:
+            cnt = process(dbRows(db, args), args, sock, targets, master)
+    dt = time.monotonic() - t0
+    logging.info("Pass %s sent %s records in %.1f seconds, %.0f records/second",
+            repeat, cnt, dt, cnt / dt if dt > 0 else 0)
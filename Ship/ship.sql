@@ -35,6 +35,15 @@ CREATE OR REPLACE TRIGGER ship_updated AFTER INSERT OR UPDATE
 
 CREATE TABLE IF NOT EXISTS filePosition ( -- Position to start reading records from
   filename TEXT COMPRESSION lz4 PRIMARY KEY,
-  position BIGINT
+  position BIGINT,
+  size BIGINT, -- What the file looked like when it was last read, see scs2NC.py
+  mtime DOUBLE PRECISION,
+  inode BIGINT
 ); -- filePosition
 
+-- Tables created before size, mtime, and inode were added
+ALTER TABLE filePosition
+  ADD COLUMN IF NOT EXISTS size BIGINT,
+  ADD COLUMN IF NOT EXISTS mtime DOUBLE PRECISION,
+  ADD COLUMN IF NOT EXISTS inode BIGINT;
+
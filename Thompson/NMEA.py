@@ -0,0 +1,360 @@
+#! /usr/bin/env python3
+#
+# Decode NMEA and SCS sentences with a registry of declarative field specifications,
+# shared by udpProcess.py and scs2NC.py
+#
+# A specification maps output names to the field index(es) of a sentence and a converter.
+# Index 0 is the sentence identifier, $GPGGA, for $ records,
+# or the first data field for SCS records without one, e.g. TSG.
+# Parsers are looked up by the full identifier, $PKEL99, then by the sentence type, GGA,
+# so a talker does not need to be known in advance.
+#
+# Units are the native units of the sentence, except where noted.
+#
+# Parsers also decode whole pandas DataFrames of string fields at once, Parser.frame,
+# when every converter has a vectorized equivalent.
+#
+# Oct-2026, Pat Welch, pat@mousebrains.com
+
+import math
+import re
+try:
+    import numpy as np
+    import pandas as pd
+    qPandas = True
+except:
+    qPandas = False
+
+# Checksummed NMEA sentence, body and checksum
+SENTENCE = re.compile(r"^([$][A-Z0-9]+,.+)[*]([0-9A-Fa-f]{2})$")
+
+def degMin(degMin:str, direction:str) -> float:
+    try:
+        degMin = float(degMin)
+    except ValueError:
+        return None
+
+    sgn = -1 if degMin < 0 else 1
+    sgn*= -1 if direction.upper() in ("S", "W") else 1
+    degMin = abs(degMin)
+    deg = math.floor(degMin/100)
+    minutes = degMin % 100
+    return sgn * (deg + minutes / 60)
+
+def real(val:str) -> float:
+    try:
+        return float(val)
+    except ValueError:
+        return None
+
+def integer(val:str) -> int:
+    try:
+        return int(val)
+    except ValueError:
+        return None
+
+def text(val:str) -> str:
+    return val if val else None
+
+def scaled(norm:float):
+    ''' Converter for a float times norm '''
+    def conv(val:str) -> float:
+        try:
+            return norm * float(val)
+        except ValueError:
+            return None
+    conv.vector = lambda val: vReal(val) * norm
+    return conv
+
+def signed(val:str, direction:str) -> float:
+    ''' Magnetic variation, west is negative '''
+    try:
+        return (-1 if direction.upper() in ("S", "W") else 1) * float(val)
+    except ValueError:
+        return None
+
+def windSpeed(val:str, units:str) -> float:
+    ''' MWV speed in K/M/N units -> meters/second '''
+    try:
+        return float(val) * {"K": 1000/3600, "M": 1, "N": 1852/3600}[units]
+    except (ValueError, KeyError):
+        return None
+
+def procXDR(fields:list, offset:int) -> dict:
+    ''' Transducer measurements, repeated (type, value, units, name) groups '''
+    info = {}
+    for i in range(offset + 1, len(fields) - 3, 4):
+        if fields[i+3]: info[fields[i+3]] = real(fields[i+1])
+    return info if info else None
+
+def procFluorometer(fields:list, offset:int) -> dict:
+    items = fields[offset].split("\t")
+    if len(items) < 6: return None
+    return {
+            "fluorometer": int(items[4]),
+            "flThermistor": int(items[5]),
+            }
+
+def procFluorometerFrame(df, offset:int):
+    items = df[offset].str.split("\t", expand=True)
+    if items.shape[1] < 6: return pd.DataFrame(index=df.index[:0])
+    items = items[items[5].notna()]
+    return pd.DataFrame({
+        "fluorometer": pd.to_numeric(items[4], errors="coerce"),
+        "flThermistor": pd.to_numeric(items[5], errors="coerce"),
+        }, index=items.index)
+
+# Vectorized equivalents of the converters, taking pandas Series of strings
+
+def vReal(val):
+    return pd.to_numeric(val, errors="coerce")
+
+def vText(val):
+    return val.where(val != "")
+
+def vDegMin(degMin, direction):
+    degMin = vReal(degMin)
+    sgn = np.where(degMin < 0, -1, 1) * np.where(direction.str.upper().isin(("S", "W")), -1, 1)
+    degMin = degMin.abs()
+    return sgn * (np.floor(degMin / 100) + (degMin % 100) / 60)
+
+def vSigned(val, direction):
+    return vReal(val) * np.where(direction.str.upper().isin(("S", "W")), -1, 1)
+
+def vWindSpeed(val, units):
+    return vReal(val) * units.map({"K": 1000/3600, "M": 1, "N": 1852/3600})
+
+vectors = {
+        real: vReal,
+        integer: vReal,
+        text: vText,
+        degMin: vDegMin,
+        signed: vSigned,
+        windSpeed: vWindSpeed,
+        }
+
+class Parser:
+    '''
+    A compiled specification
+    fields is {name: (index, converter)} or {name: ((index, index), converter)}
+    require and reject are {index: value} conditions for the sentence to be used
+    func(fields, offset) is for sentences which do not fit the declarative form
+    vfunc(df, offset) is its vectorized equivalent, if there is one
+    names are the keys func returns, if they are known in advance
+    '''
+    __slots__ = ("name", "names", "__single", "__double", "__require", "__reject", "__nFields", "__func",
+                 "__vfunc", "__vectors")
+
+    def __init__(self, name:str, fields:dict=None, require:dict=None, reject:dict=None,
+                 func=None, vfunc=None, names:tuple=None, nFields:int=None) -> None:
+        self.name = name
+        self.names = tuple(fields) if fields else names # Output keys, None if not known
+        self.__single = [] # (name, index, converter)
+        self.__double = [] # (name, index, index, converter)
+        for (key, (index, conv)) in (fields or {}).items():
+            if isinstance(index, tuple):
+                self.__double.append((key, index[0], index[1], conv))
+            else:
+                self.__single.append((key, index, conv))
+        self.__require = tuple((require or {}).items())
+        self.__reject = tuple((reject or {}).items())
+        indices = [index for (key, index, conv) in self.__single]
+        indices.extend(max(i, j) for (key, i, j, conv) in self.__double)
+        indices.extend(key for (key, val) in self.__require + self.__reject)
+        self.__nFields = nFields if nFields is not None else (max(indices) + 1 if indices else 1)
+        self.__func = func
+        self.__vfunc = vfunc
+        self.__vectors = None # Vectorized converters, if all of them have one
+        convs = [item[-1] for item in self.__single + self.__double]
+        convs = [getattr(conv, "vector", None) or vectors.get(conv) for conv in convs]
+        if func is None and all(convs):
+            self.__vectors = [(item[0], item[1:-1], conv)
+                              for (item, conv) in zip(self.__single + self.__double, convs)]
+
+    def __call__(self, fields:list, offset:int=0) -> dict:
+        ''' Decode fields[offset:], returns None if the sentence is not usable '''
+        if len(fields) - offset < self.__nFields: return None
+        for (index, val) in self.__require:
+            if fields[offset + index] != val: return None
+        for (index, val) in self.__reject:
+            if fields[offset + index] == val: return None
+        if self.__func is not None: return self.__func(fields, offset)
+        info = {key: conv(fields[offset + index]) for (key, index, conv) in self.__single}
+        for (key, i, j, conv) in self.__double:
+            info[key] = conv(fields[offset + i], fields[offset + j])
+        return info
+
+    def qVector(self) -> bool:
+        return qPandas and (self.__vectors is not None or self.__vfunc is not None)
+
+    def frame(self, df, offset:int=0):
+        '''
+        Vectorized decode of a DataFrame of string fields, with columns 0, 1, ...
+        returns a DataFrame of the usable rows, keeping df's index
+        '''
+        last = offset + self.__nFields - 1
+        if last not in df.columns: return pd.DataFrame(index=df.index[:0])
+        mask = df[last].notna()
+        for (index, val) in self.__require:
+            mask &= df[offset + index] == val
+        for (index, val) in self.__reject:
+            mask &= df[offset + index] != val
+        df = df[mask]
+        if self.__vfunc is not None: return self.__vfunc(df, offset)
+        return pd.DataFrame({key: conv(*[df[offset + i] for i in indices])
+                             for (key, indices, conv) in self.__vectors}, index=df.index)
+
+registry = {} # identifier or sentence type -> Parser
+cache = {} # identifier -> Parser or None
+
+def register(ident:str, **kwargs) -> Parser:
+    ''' Add a parser for a full identifier, $PKEL99, or a sentence type, GGA '''
+    parser = Parser(ident, **kwargs)
+    registry[ident] = parser
+    cache.clear()
+    return parser
+
+def lookup(ident:str) -> Parser:
+    ''' Parser for an identifier, full identifier first, then sentence type, else None '''
+    try:
+        return cache[ident]
+    except KeyError:
+        pass
+    parser = registry.get(ident)
+    if parser is None and len(ident) == 6 and ident[0] == "$":
+        parser = registry.get(ident[3:]) # Strip $ and the talker
+    cache[ident] = parser
+    return parser
+
+def decode(fields:list, offset:int=0, ident:str=None) -> dict:
+    ''' Decode fields[offset:], using ident for sentences without an identifier '''
+    parser = lookup(ident if ident is not None else fields[offset])
+    return None if parser is None else parser(fields, offset)
+
+# Standard NMEA sentences, any talker
+
+register("RMC", require={2: "A"}, fields={
+    "fixTime": (1, text), # hhmmss.ss
+    "lat": ((3, 4), degMin),
+    "lon": ((5, 6), degMin),
+    "sog": (7, real), # knots
+    "cog": (8, real), # degrees true
+    "fixDate": (9, text), # ddmmyy
+    "magVar": ((10, 11), signed),
+    })
+
+register("GGA", reject={6: "0"}, fields={ # Fix quality 0 is invalid
+    "fixTime": (1, text), # hhmmss.ss
+    "lat": ((2, 3), degMin),
+    "lon": ((4, 5), degMin),
+    "dilution": (8, real),
+    "altitude": (9, real), # meters
+    "height": (11, real), # Geoid separation in meters
+    })
+
+register("VTG", fields={
+    "cog": (1, real), # degrees true
+    "sog": (5, scaled(1852/3600)), # knots -> meters/second
+    })
+
+register("HDT", fields={
+    "heading": (1, real), # degrees true
+    })
+
+register("ZDA", fields={
+    "fixTime": (1, text), # hhmmss.ss
+    "day": (2, integer),
+    "month": (3, integer),
+    "year": (4, integer),
+    })
+
+register("MWV", require={5: "A"}, fields={
+    "wAngle": (1, real), # degrees
+    "wReference": (2, text), # R relative or T theoretical
+    "wSpeed": ((3, 4), windSpeed), # meters/second
+    })
+
+register("XDR", func=procXDR, nFields=5)
+
+register("DPT", fields={
+    "depth": (1, real), # meters below the transducer
+    "depthOffset": (2, real), # meters, transducer to waterline if positive
+    })
+
+# Proprietary and SCS derived sentences
+
+register("$PKEL99", require={2: "0"}, fields={
+    "depthKN": (1, real),
+    })
+
+register("$TWIND", fields={
+    "wSpd": (1, real),
+    "wDir": (2, real),
+    })
+
+register("$PPAR", fields={
+    "par": (1, real),
+    })
+
+register("$METED", fields={
+    "Tair": (3, real),
+    "RH": (4, real),
+    "Pair": (5, real),
+    })
+
+register("$WIR37", fields={
+    "longWave": (5, real),
+    "shortWave": (8, real),
+    })
+
+register("$DEPTH", fields={
+    "depthMB": (1, real),
+    })
+
+# SCS records without a sentence identifier, known by their filename
+
+register("SBE38", fields={
+    "Tinlet": (0, real),
+    })
+
+register("TSG", fields={
+    "Ttsg": (0, real),
+    "cond": (1, real),
+    "salinity": (2, real),
+    })
+
+register("SS", fields={
+    "spdSound": (0, real),
+    })
+
+register("FLUOROMETER", func=procFluorometer, vfunc=procFluorometerFrame,
+         names=("fluorometer", "flThermistor"), nFields=1)
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    import time
+
+    parser = ArgumentParser(description="Benchmark the sentence decoders")
+    parser.add_argument("--n", type=int, default=100000, help="Sentences per type")
+    args = parser.parse_args()
+
+    samples = (
+            ("$GPRMC,123519,A,4807.038,N,01131.000,E,022.4,084.4,230394,003.1,W", None),
+            ("$GPGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,", None),
+            ("$GPVTG,054.7,T,034.4,M,005.5,N,010.2,K", None),
+            ("$HEHDT,274.07,T", None),
+            ("$GPZDA,201530.00,04,07,2002,00,00", None),
+            ("$WIMWV,214.8,R,0.1,K,A", None),
+            ("$WIXDR,C,19.3,C,AIRTEMP,P,1.0130,B,BARO", None),
+            ("$SDDPT,76.1,0.0,100", None),
+            ("$PKEL99,1234.5,0,1", None),
+            ("$TWIND,5.4,123.4", None),
+            ("21.345,5.123,34.567", "TSG"),
+            )
+    for (line, ident) in samples:
+        fields = line.split(",")
+        t0 = time.perf_counter()
+        for i in range(args.n):
+            val = decode(fields, 0, ident)
+        dt = time.perf_counter() - t0
+        print(f"{ident or fields[0]:>8s} {args.n/dt:12,.0f} sentences/second {val}")
@@ -0,0 +1,89 @@
+#! /usr/bin/env python3
+#
+# Benchmark appending a synthetic day of 1Hz data to a NetCDF file,
+# the original per-row fancy indexed writes, default chunking and complevel 4, versus
+# the contiguous slab writes in scs2NC.saveColumns with the catalog's settings
+#
+# Oct-2026, Pat Welch, pat@mousebrains.com
+
+from argparse import ArgumentParser
+from netCDF4 import Dataset
+from mkNC import createNetCDF
+from catalog import loadCatalog
+import numpy as np
+import os
+import tempfile
+import time
+import scs2NC
+
+def fancy(nc, columns:dict, tBase:np.datetime64) -> None:
+    ''' The original writer, per-row integer offsets '''
+    tAll = []
+    for key in columns:
+        (t, values) = columns[key]
+        t = (t - tBase).astype("timedelta64[s]").astype(np.int64)
+        nc.variables[key][t] = values
+        tAll.append(t)
+    t = np.unique(np.concatenate(tAll))
+    nc.variables["t"][t] = t
+
+def mkColumns(n:int, tBase:np.datetime64, dropout:float) -> dict:
+    rng = np.random.default_rng(1234)
+    t = tBase + np.arange(n).astype("timedelta64[s]")
+    columns = {}
+    with tempfile.TemporaryDirectory() as directory: # For the variable names and types
+        fn = os.path.join(directory, "x.nc")
+        createNetCDF(fn, tBase)
+        with Dataset(fn, "r") as nc:
+            for key in nc.variables:
+                if key == "t": continue
+                qKeep = rng.random(n) >= dropout # Some sensors miss some seconds
+                dtype = nc.variables[key].dtype
+                values = rng.random(n) * 100 if dtype.kind == "f" else rng.integers(0, 4096, n)
+                columns[key] = (t[qKeep], values[qKeep].astype(dtype))
+    return columns
+
+def run(name:str, writer, chunkSize:int, catalog:dict, columns:dict, args:ArgumentParser,
+        tBase:np.datetime64, directory:str) -> str:
+    fn = os.path.join(directory, name + ".nc")
+    createNetCDF(fn, tBase, chunkSize, catalog)
+    t0 = time.perf_counter()
+    for i0 in range(0, args.n, args.append): # Append a batch at a time
+        t1 = tBase + np.timedelta64(i0, "s")
+        t2 = t1 + np.timedelta64(args.append, "s")
+        batch = {}
+        for key in columns:
+            (t, values) = columns[key]
+            qBatch = np.logical_and(t >= t1, t < t2)
+            batch[key] = (t[qBatch], values[qBatch])
+        with Dataset(fn, "a") as nc:
+            writer(nc, batch, tBase)
+    dt = time.perf_counter() - t0
+    print(f"{name:>6s} {args.n // args.append} appends in {dt:.2f} seconds,",
+          f"{os.path.getsize(fn)/1024/1024:.2f} MB")
+    return fn
+
+parser = ArgumentParser()
+parser.add_argument("--n", type=int, default=86400, help="Seconds of data, 86400 is a day")
+parser.add_argument("--append", type=int, default=600, help="Seconds of data per append")
+parser.add_argument("--chunk", type=int, help="Samples per chunk for slab writes, default is the catalog")
+parser.add_argument("--dropout", type=float, default=0.01, help="Fraction of missing samples")
+args = parser.parse_args()
+
+tBase = np.datetime64("2023-04-20T00:00:00")
+columns = mkColumns(args.n, tBase, args.dropout)
+
+original = loadCatalog() # The layout before the catalog, default chunking and complevel 4
+for item in [original["defaults"]] + list(original["variables"].values()):
+    item.update(chunk=None, complevel=4, shuffle=True)
+
+with tempfile.TemporaryDirectory() as directory:
+    fnA = run("fancy", fancy, 0, original, columns, args, tBase, directory)
+    fnB = run("slab", scs2NC.saveColumns, args.chunk, None, columns, args, tBase, directory)
+    with Dataset(fnA, "r") as a, Dataset(fnB, "r") as b:
+        for key in a.variables:
+            x = a.variables[key][:]
+            y = b.variables[key][:]
+            if x.shape != y.shape or not np.ma.allequal(x, y) \
+                    or (np.ma.getmaskarray(x) != np.ma.getmaskarray(y)).any():
+                print("Mismatch", key)
@@ -0,0 +1,74 @@
+#! /usr/bin/env python3
+#
+# Benchmark parsing a synthetic day of 1Hz SCS .Raw files,
+# one procLine call per line versus the chunked vectorized loadFile in scs2NC.py
+#
+# Oct-2026, Pat Welch, pat@mousebrains.com
+
+from argparse import ArgumentParser
+import numpy as np
+import pandas as pd
+import os
+import tempfile
+import time
+import scs2NC
+
+# codigo -> function returning the record, after the date and time, for second i
+records = {
+    "SONIC-TWIND": lambda i: f"$TWIND,{5 + np.sin(i/600):.2f},{i % 360:.1f}",
+    "GGA": lambda i: f"$GPGGA,{i//3600:02d}{i//60%60:02d}{i%60:02d}.00," \
+            + f"{1230 + i/1e4:.4f},N,{14530 + i/1e4:.4f},E,2,12,0.8,12.3,M,45.6,M,,",
+    "VTG": lambda i: f"$GPVTG,{i % 360:.1f},T,{(i+5) % 360:.1f},M,{10 + i%7/10:.1f},N,,K,D",
+    "PAR": lambda i: f"$PPAR,{1000 * abs(np.sin(i/13751)):.3f}",
+    "BOW-MET": lambda i: f"$METED,1,2,{25 + i/86400:.2f},{80 + i%10:.1f},{1013 + i%5/10:.1f}",
+    "TSG": lambda i: f"{28 + i/86400:.4f},{5.6 + i/1e6:.5f},{34.5 + i/1e6:.4f}",
+    "SBE38": lambda i: f"{28 + i/86400:.4f}",
+    "FLUOROMETER": lambda i: f"a\tb\tc\td\t{i%1000}\t{500 + i%50}",
+    }
+
+def mkFiles(directory:str, n:int) -> dict:
+    t0 = np.datetime64("2023-04-20T00:00:00")
+    stamps = [pd.Timestamp(t0 + np.timedelta64(i * 1000 + (i * 37) % 1000, "ms"))
+              for i in range(n)]
+    stamps = [t.strftime("%m/%d/%Y,%H:%M:%S.") + f"{t.microsecond // 1000:03d}" for t in stamps]
+    filenames = {}
+    for codigo in records:
+        fn = os.path.join(directory, f"{codigo}-RAW_20230420-000000.Raw")
+        with open(fn, "w") as fp:
+            for i in range(n):
+                fp.write(stamps[i] + "," + records[codigo](i) + "\r\n")
+        filenames[fn] = codigo
+    return filenames
+
+def byLine(fn:str, codigo:str) -> pd.DataFrame:
+    items = []
+    with open(fn, "r") as fp:
+        for line in fp:
+            val = scs2NC.procLine(line, codigo)
+            if val: items.append(val)
+    return pd.DataFrame(items)
+
+parser = ArgumentParser()
+parser.add_argument("--n", type=int, default=86400, help="Records per file, 86400 is a day at 1Hz")
+args = parser.parse_args()
+
+with tempfile.TemporaryDirectory() as directory:
+    filenames = mkFiles(directory, args.n)
+    nRows = args.n * len(filenames)
+    results = {}
+    for name in ("byLine", "loadFile"):
+        t0 = time.perf_counter()
+        results[name] = [byLine(fn, filenames[fn]) if name == "byLine" else \
+                scs2NC.loadFile(fn, 0, filenames[fn])[0] for fn in filenames]
+        dt = time.perf_counter() - t0
+        print(f"{name:>8s} {nRows} rows in {dt:.2f} seconds, {nRows/dt:,.0f} rows/second")
+
+    for (fn, a, b) in zip(filenames, results["byLine"], results["loadFile"]):
+        for key in b: # Only the variables kept in the catalog
+            if a[key].dtype.kind == "M":
+                qSame = (a[key].to_numpy() == b[key].to_numpy()).all()
+            elif a[key].dtype.kind == "O":
+                qSame = (a[key].fillna("") == b[key].fillna("")).all()
+            else:
+                qSame = np.allclose(a[key].astype(float), b[key].astype(float), equal_nan=True)
+            if not qSame: print("Mismatch", os.path.basename(fn), key)
@@ -0,0 +1,43 @@
+#
+# Load the variable catalog, variables.yaml, shared by mkNC.py and scs2NC.py,
+# so the NetCDF layout and which parser outputs are kept stay consistent
+#
+# Oct-2026, Pat Welch, pat@mousebrains.com
+
+import os.path
+import numpy as np
+import yaml
+import NMEA
+
+def loadCatalog(fn:str=None) -> dict:
+    ''' Load fn, variables.yaml next to this file by default, and fill in the defaults '''
+    if fn is None: fn = os.path.join(os.path.dirname(os.path.abspath(__file__)), "variables.yaml")
+    with open(fn, "r") as fp:
+        info = yaml.safe_load(fp)
+
+    for key in ("time", "variables"):
+        if key not in info: raise ValueError(f"Required field, {key}, not in {fn}")
+
+    defaults = info.get("defaults", {})
+    for (name, item) in info["variables"].items():
+        for key in defaults: item.setdefault(key, defaults[key])
+        dtype = np.dtype(item["dtype"])
+        if "fill" in item:
+            item["fill"] = dtype.type(item["fill"])
+        elif dtype.kind == "f":
+            item["fill"] = dtype.type(np.nan)
+        for src in item.get("source", []):
+            parser = NMEA.lookup(src)
+            if parser is None:
+                raise ValueError(f"Unknown source, {src}, for {name} in {fn}")
+            if parser.names is not None and name not in parser.names:
+                raise ValueError(f"{src} does not produce {name} in {fn}")
+    return info
+
+def sources(catalog:dict) -> dict:
+    ''' Parser name -> variable names kept from it '''
+    items = {}
+    for (name, item) in catalog["variables"].items():
+        for src in item.get("source", []):
+            items.setdefault(NMEA.lookup(src).name, []).append(name)
+    return {key: tuple(items[key]) for key in items}
@@ -0,0 +1,150 @@
+#! /usr/bin/env python3
+#
+# Maintain 1 and 10 minute means of a daily 1Hz ship NetCDF file in sibling files,
+# ship.DATE.nc -> ship.DATE.1min.nc and ship.DATE.10min.nc
+#
+# Only the bins touched by the newly appended seconds are recomputed,
+# which includes the partial bin at the end of the previous append.
+#
+# Direction/speed pairs, wDir/wSpd and cog/sog, are averaged as speed weighted vectors,
+# the direction of the mean vector along with the scalar mean speed.
+#
+# Oct-2026, Pat Welch, pat@mousebrains.com
+
+from netCDF4 import Dataset
+import numpy as np
+import os.path
+import logging
+from mkNC import createNetCDF
+from catalog import loadCatalog
+
+def mkSuffix(period:int) -> str:
+    return f"{period // 60}min" if not period % 60 else f"{period}sec"
+
+def mkFilename(fn:str, period:int) -> str:
+    ''' ship.DATE.nc -> ship.DATE.1min.nc '''
+    (prefix, ext) = os.path.splitext(fn)
+    return f"{prefix}.{mkSuffix(period)}{ext}"
+
+def mkCatalog(catalog:dict, period:int) -> dict:
+    ''' The catalog for the means, floating point with NaN fill and a day per chunk '''
+    info = dict(catalog)
+    info["attributes"] = catalog.get("attributes", {}) \
+            | dict(averaging=f"{period} second means of the 1Hz ship data")
+    info["defaults"] = catalog.get("defaults", {}) | dict(chunk=max(1, 86400 // period))
+    info["variables"] = {}
+    for (name, item) in catalog["variables"].items():
+        item = dict(item)
+        item.pop("chunk", None) # Sized for the 1Hz file
+        item["dtype"] = "f8" if np.dtype(item["dtype"]) == np.float64 else "f4"
+        item["fill"] = np.dtype(item["dtype"]).type(np.nan)
+        info["variables"][name] = item
+    return info
+
+def getSecondOfDay(units:str) -> int:
+    ''' Seconds since midnight of the t units' base time, so bins align with the clock '''
+    tBase = np.datetime64(units[units.find("since ") + len("since "):], "s")
+    return int((tBase - tBase.astype("datetime64[D]")).astype(np.int64))
+
+def binMeans(values:np.ndarray, period:int) -> np.ndarray:
+    ''' NaN ignoring means of consecutive period long bins '''
+    values = values.reshape(-1, period)
+    qValid = ~np.isnan(values)
+    n = qValid.sum(axis=1)
+    total = np.where(qValid, values, 0).sum(axis=1)
+    means = np.full(n.shape, np.nan)
+    np.divide(total, n, out=means, where=n > 0)
+    return means
+
+def vectorMeans(direction:np.ndarray, speed:np.ndarray, period:int) -> tuple:
+    ''' Speed weighted direction, in degrees, and scalar mean speed '''
+    qValid = np.logical_and(~np.isnan(direction), ~np.isnan(speed))
+    direction = np.where(qValid, direction, np.nan)
+    speed = np.where(qValid, speed, np.nan)
+    theta = np.radians(direction)
+    u = binMeans(speed * np.sin(theta), period)
+    v = binMeans(speed * np.cos(theta), period)
+    return (np.degrees(np.arctan2(u, v)) % 360, binMeans(speed, period))
+
+def readSlab(var, i0:int, i1:int) -> np.ndarray:
+    ''' var[i0:i1] as float64 with NaN for missing, including outside of the file '''
+    values = np.full(i1 - i0, np.nan)
+    j0 = max(i0, 0)
+    j1 = min(i1, var.shape[0])
+    if j1 > j0:
+        values[j0-i0:j1-i0] = np.ma.filled(var[j0:j1].astype(np.float64), np.nan)
+    return values
+
+def downsample(fn:str, i0:int=None, i1:int=None, catalog:dict=None) -> None:
+    '''
+    Update the means files of fn for the 1Hz indices [i0, i1),
+    by default from where the last update stopped to the end of fn
+    '''
+    catalog = loadCatalog() if catalog is None else catalog
+    info = catalog.get("downsample", {})
+    periods = info.get("periods", [])
+    vectors = info.get("vectors", {})
+    if not periods: return
+
+    with Dataset(fn, "r") as nc:
+        units = nc.variables["t"].getncattr("units")
+        s0 = getSecondOfDay(units)
+        nTotal = nc.variables["t"].shape[0]
+        ofns = {period: mkFilename(fn, period) for period in periods}
+        if i0 is None:
+            i0 = nTotal
+            for ofn in ofns.values():
+                if not os.path.isfile(ofn):
+                    i0 = 0
+                    break
+                with Dataset(ofn, "r") as ds:
+                    i0 = min(i0, int(getattr(ds, "processedThrough", 0)))
+        i1 = nTotal if i1 is None else i1
+        if i1 <= i0: return
+
+        # Bin k of the day covers the 1Hz indices [k * period - s0, (k+1) * period - s0)
+        bins = {p: ((i0 + s0) // p, (i1 - 1 + s0) // p + 1) for p in periods}
+        j0 = min(k0 * p - s0 for (p, (k0, k1)) in bins.items())
+        j1 = max(k1 * p - s0 for (p, (k0, k1)) in bins.items())
+        names = [name for name in catalog["variables"] if name in nc.variables]
+        slabs = {name: readSlab(nc.variables[name], j0, j1) for name in names}
+
+    for period in periods:
+        (k0, k1) = bins[period]
+        (a, b) = (k0 * period - s0 - j0, k1 * period - s0 - j0)
+        means = {name: binMeans(slabs[name][a:b], period) for name in names}
+        for (direction, speed) in vectors.items():
+            if direction in slabs and speed in slabs:
+                (means[direction], means[speed]) = \
+                        vectorMeans(slabs[direction][a:b], slabs[speed][a:b], period)
+
+        ofn = ofns[period]
+        if not os.path.isfile(ofn):
+            createNetCDF(ofn, np.datetime64(units[units.find("since ") + len("since "):]),
+                         catalog=mkCatalog(catalog, period))
+            with Dataset(ofn, "a") as nc:
+                nc.variables["t"].setncattr("comment", "Center of the averaging interval")
+                for name in names:
+                    method = "t: mean" if name not in vectors else "t: mean (vector)"
+                    nc.variables[name].setncattr("cell_methods", method)
+        with Dataset(ofn, "a") as nc:
+            kStart = min(k0, nc.variables["t"].shape[0]) # Keep t regular across gaps
+            nc.variables["t"][kStart:k1] = np.arange(kStart, k1) * period - s0 + period // 2
+            for name in names:
+                nc.variables[name][k0:k1] = means[name]
+            nc.processedThrough = max(i1, int(getattr(nc, "processedThrough", 0)))
+        logging.debug("Updated %s bins [%s, %s)", os.path.basename(ofn), k0, k1)
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser()
+    parser.add_argument("nc", type=str, nargs="+", help="Daily 1Hz ship NetCDF files")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute the means from scratch")
+    parser.add_argument("--verbose", action="store_true", help="Enable debug messages")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+
+    for fn in args.nc:
+        downsample(fn, 0 if args.rebuild else None)
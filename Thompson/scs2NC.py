@@ -2,154 +2,83 @@
 #
 # Process various Sonic wind bow sensor for true speed and direction
 #
+# Run from a timer it appends whatever is new since the last run,
+# or with --daemon it keeps running and appends files as inotify reports they changed.
+#
 # April-2023, Pat Welch, pat@mousebrains.com
 
 import logging
 import os.path
-import glob
 import datetime
-import math
 import re
 import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 import numpy as np
 import pandas as pd
 from mkNC import createNetCDF
+from downsample import downsample
+from catalog import loadCatalog, sources
+import NMEA
 from netCDF4 import Dataset
 import psycopg
-import sys
-
-def mkFilenames(paths:tuple, cur) -> dict:
-    patterns = {
-        "MET": re.compile(r"^(SONIC-TWIND|PAR|BOW-MET|RAD)-RAW_([0-9]+)-[0-9]+"),
-        "NAV": re.compile(r"^CNAV3050-(GGA|VTG)-RAW_([0-9]+)-[0-9]+"),
-        "SEAWATER": re.compile(r"^(FLUOROMETER|TSG|SBE38)-RAW_([0-9]+)-[0-9]+"),
-        "SOUNDERS": re.compile(r"^(KNUDSEN-PKEL99-RAW|MB-DEPTH)_([0-9]+)-[0-9]+"),
-        }
-
-    sql = "SELECT position FROM fileposition WHERE filename=%s;"
-
+import queue
+from argparse import ArgumentParser
+from TPWUtils.Thread import Thread
+
+# Parser name -> the variables kept from it, from variables.yaml
+catalog = loadCatalog()
+kept = sources(catalog)
+
+# SCS subdirectory -> filename pattern, (record type, date)
+patterns = {
+    "MET": re.compile(r"^(SONIC-TWIND|PAR|BOW-MET|RAD)-RAW_([0-9]+)-[0-9]+"),
+    "NAV": re.compile(r"^CNAV3050-(GGA|VTG)-RAW_([0-9]+)-[0-9]+"),
+    "SEAWATER": re.compile(r"^(FLUOROMETER|TSG|SBE38)-RAW_([0-9]+)-[0-9]+"),
+    "SOUNDERS": re.compile(r"^(KNUDSEN-PKEL99-RAW|MB-DEPTH)_([0-9]+)-[0-9]+"),
+    }
+
+def loadKnown(db, cur) -> dict:
+    ''' filename -> (position, size, mtime, inode) for all the files read so far '''
+    # All the known positions in one query, the columns are defined in Ship/ship.sql
+    cur.execute("SELECT filename,position,size,mtime,inode FROM fileposition;")
+    known = {row[0]: row[1:] for row in cur}
+    db.commit()
+    return known
+
+def addFilename(items:dict, fn:str, expr, known:dict, st:os.stat_result=None) -> None:
+    ''' Add fn to items, date -> {fn: (position, codigo, (size, mtime, inode))}, if it grew '''
+    matches = expr.match(os.path.basename(fn))
+    if not matches: return
+    try:
+        st = os.stat(fn) if st is None else st
+    except FileNotFoundError:
+        return
+    info = (st.st_size, st.st_mtime, st.st_ino)
+    (pos, size, mtime, inode) = known.get(fn, (None, None, None, None))
+    if (size, mtime, inode) == info: return # Unchanged since it was last read
+    if pos and ((inode is not None and inode != info[2]) or info[0] < pos):
+        pos = None # Replaced or truncated, so start over
+    if pos and info[0] == pos: return # Nothing new
+    date = matches[2]
+    if date not in items: items[date] = {}
+    items[date][fn] = (pos, matches[1], info)
+
+def mkFilenames(paths:tuple, known:dict) -> dict:
     items = {}
     for path in paths:
         for subdir in patterns:
             expr = patterns[subdir]
-            for fn in glob.glob(os.path.join(path, subdir, "*.Raw")):
-                matches = expr.match(os.path.basename(fn))
-                if not matches: continue
-                pos = None
-                cur.execute(sql, (fn,))
-                for row in cur:
-                    pos = row[0]
-                    break
-
-                if pos and os.path.getsize(fn) == pos: continue
-                date = matches[2]
-                if date not in items: items[date] = {}
-                items[date][fn] = (pos, matches[1])
+            try:
+                entries = os.scandir(os.path.join(path, subdir))
+            except FileNotFoundError:
+                continue
+            with entries:
+                for entry in entries:
+                    if not entry.name.endswith(".Raw"): continue
+                    addFilename(items, entry.path, expr, known, entry.stat())
     return items
 
-def decodeDegMin(degMin:str, direction:str) -> float:
-    try:
-        degMin = float(degMin)
-    except:
-        return None
-
-    sgn = -1 if degMin < 0 else 1
-    sgn*= -1 if direction.upper() in ("S", "W") else 1
-    degMin = abs(degMin)
-    deg = math.floor(degMin/100)
-    minutes = degMin % 100
-    return sgn * (deg + minutes / 60)
-
-def decodeFloat(val:str, norm:float=1.0) -> float:
-    try:
-        return norm * float(val)
-    except:
-        return None
-
-def procTWind(fields:tuple) -> dict:
-    return {"wSpd": decodeFloat(fields[3]), "wDir": decodeFloat(fields[4])}
-
-def procGGA(fields:tuple) -> dict:
-    return {
-            "lat": decodeDegMin(fields[4], fields[5]),
-            "lon": decodeDegMin(fields[6], fields[7]),
-            }
-
-def procVTG(fields:tuple) -> dict:
-    return {
-            "cog": decodeFloat(fields[3]),
-            "sog": decodeFloat(fields[7], 1852/3600), # knots -> meters/sec
-            }
-
-def procPAR(fields:tuple) -> dict:
-    return {
-            "par": decodeFloat(fields[3]),
-            }
-
-def procSpeedOfSound(fields:tuple) -> dict:
-    return {
-            "spdSound": decodeFloat(fields[2]),
-            }
-
-def procSBE38(fields:tuple) -> dict:
-    return {
-            "Tinlet": decodeFloat(fields[2]),
-            }
-
-def procTSG(fields:tuple) -> dict:
-    return {
-            "Ttsg": decodeFloat(fields[2]),
-            "cond": decodeFloat(fields[3]),
-            "salinity": decodeFloat(fields[4]),
-            }
-
-def procFluorometer(fields:tuple) -> dict:
-    items = fields[2].split("\t")
-    if len(items) < 6: return None
-    return {
-            "fluorometer": int(items[4]),
-            "flThermistor": int(items[5]),
-            }
-
-def procBowMet(fields:tuple) -> dict:
-    return {
-            "Tair": decodeFloat(fields[5]),
-            "RH": decodeFloat(fields[6]),
-            "Pair": decodeFloat(fields[7]),
-            }
-
-def procRadiation(fields:tuple) -> dict:
-    return {
-            "longWave": decodeFloat(fields[7]),
-            "shortWave": decodeFloat(fields[10]),
-            }
-
-def procPKEL99(fields:tuple) -> dict:
-    if fields[4] != '0': return None
-    return {
-            "depthKN": decodeFloat(fields[3]),
-            }
-
-def procMBdepth(fields:tuple) -> dict:
-    return {
-            "depthMB": decodeFloat(fields[3]),
-            }
-
-codigos = {
-        "$TWIND": procTWind,
-        "$GPGGA": procGGA,
-        "$GPVTG": procVTG,
-        "$PPAR": procPAR,
-        "$METED": procBowMet,
-        "$WIR37": procRadiation,
-        "$PKEL99": procPKEL99,
-        "$DEPTH": procMBdepth,
-        "SBE38": procSBE38,
-        "TSG": procTSG,
-        "SS": procSpeedOfSound,
-        "FLUOROMETER": procFluorometer,
-        }
-
 def procLine(line:str, codigo:str=None) -> dict:
     if not line: return None
     fields = line.strip().split(",")
@@ -164,79 +93,234 @@ def procLine(line:str, codigo:str=None) -> dict:
 
         if fields[2][0] == "$": codigo = fields[2]
 
-        if codigo not in codigos:
+        parser = NMEA.lookup(codigo)
+        if parser is None:
             logging.warning("Unsupported record type, %s", codigo)
             return None
 
-        val = codigos[codigo](fields)
+        val = parser(fields, 2) # Sentence starts after the date and time
         return ({"t": tt, "dt": dt} | val) if val else None
     except:
         logging.exception("codigo %s Fields %s", codigo, fields)
 
-def loadFile(fn:str, pos:int, codigo:str) -> tuple:
-    items = []
-    with open(fn, "r") as fp:
+def parseLines(lines:list, codigo:str=None) -> pd.DataFrame:
+    ''' Vectorized procLine for a chunk of lines, one pass per record type '''
+    lines = pd.Series(lines, dtype=object).str.strip()
+    lines = lines[lines.str.len() > 0]
+    fields = lines.str.split(",", expand=True)
+    if fields.shape[1] < 3: return None
+    fields = fields[fields[2].notna()]
+
+    # Few distinct dates, so parse those once, plus a vectorized time of day
+    dates = {date: pd.to_datetime(date, format="%m/%d/%Y", errors="coerce")
+             for date in fields[0].unique()}
+    t = fields[0].map(dates) + pd.to_timedelta(fields[1], errors="coerce")
+    fields = fields[t.notna()]
+    t = t[t.notna()]
+    tt = (t + pd.Timedelta(milliseconds=500)).dt.floor("s") # Nearest second
+    dt = (t - tt).dt.total_seconds()
+
+    idents = fields[2].where(fields[2].str.startswith("$"), codigo)
+    frames = []
+    for (ident, grp) in fields.groupby(idents, sort=False):
+        parser = NMEA.lookup(ident)
+        if parser is None:
+            logging.warning("Unsupported record type, %s", ident)
+            continue
+        names = kept.get(parser.name)
+        if not names: continue # Nothing from this record type is saved
+        if not parser.qVector(): # Fall back to one line at a time
+            items = [procLine(line, codigo) for line in lines[grp.index]]
+            items = [item for item in items if item]
+            if items: frames.append(pd.DataFrame(items)[["t", "dt", *names]])
+            continue
+        df = parser.frame(grp, 2) # Sentence starts after the date and time
+        if df.empty: continue
+        df = df[list(names)]
+        df.insert(0, "t", tt[df.index])
+        df.insert(1, "dt", dt[df.index])
+        frames.append(df)
+
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+def loadFile(fn:str, pos:int, codigo:str, chunkSize:int=16*1024*1024) -> tuple:
+    frames = []
+    with open(fn, "rb") as fp:
         if pos: fp.seek(pos)
-        for line in fp:
-            val = procLine(line, codigo)
-            if val: items.append(val)
-        pos = fp.tell()
-    if not items: return (None, pos) # In case there is nothing
-    df = pd.DataFrame(items)
+        tail = b""
+        while True:
+            buffer = fp.read(chunkSize)
+            if not buffer: break
+            buffer = tail + buffer
+            index = buffer.rfind(b"\n") + 1 # Only complete lines
+            (buffer, tail) = (buffer[:index], buffer[index:])
+            if not buffer: continue
+            df = parseLines(str(buffer, "utf-8", errors="replace").split("\n"), codigo)
+            if df is not None: frames.append(df)
+        pos = fp.tell() - len(tail) # A partial last line is read next time
+    if not frames: return (None, pos) # In case there is nothing
+    df = pd.concat(frames, ignore_index=True)
     return (df, pos)
 
-def saveDataframe(nc, df:pd.DataFrame, tBase:np.int64) -> None:
-    t = (df.t - tBase).astype("timedelta64[s]").astype(np.int64)
-
-    nc.variables["t"][t] = t
+def loadColumns(fn:str, pos:int, codigo:str) -> tuple:
+    '''
+    loadFile for a process pool, returns numeric NumPy columns, not a DataFrame,
+    so little has to be pickled back
+    '''
+    t0 = time.time()
+    (df, pos) = loadFile(fn, pos, codigo)
+    if df is None or df.empty: return (fn, None, pos, time.time() - t0)
+    columns = {key: df[key].to_numpy() for key in df if df[key].dtype.kind in "fiubM"}
+    return (fn, columns, pos, time.time() - t0)
+
+def mergeColumns(frames:list) -> dict:
+    ''' key -> (t, values) with all the frames which have that key '''
+    items = {}
+    for columns in frames:
+        for key in columns:
+            if key in ["t", "dt"]: continue
+            items.setdefault(key, []).append((columns["t"], columns[key]))
+    return {key: (np.concatenate([item[0] for item in items[key]]),
+                  np.concatenate([item[1] for item in items[key]]))
+            for key in items}
+
+def writeSlab(var, index:np.ndarray, values:np.ndarray) -> None:
+    '''
+    Overlay values at index onto var with one contiguous read and write,
+    rather than scattered writes into compressed chunks
+    '''
+    if values.dtype.kind == "f": # Missing values keep what is already there
+        qValid = ~np.isnan(values)
+        (index, values) = (index[qValid], values[qValid])
+    if not index.size: return
+    i0 = index.min()
+    i1 = index.max() + 1
+    slab = np.ma.masked_all(i1 - i0, dtype=var.dtype)
+    n = min(i1, var.shape[0]) - i0 # Overlap with what is already in the file
+    if n > 0: slab[:n] = var[i0:i0+n]
+    slab[index - i0] = values
+    var[i0:i1] = slab
+
+def saveColumns(nc, columns:dict, tBase:np.int64) -> tuple:
+    '''
+    Write key -> (t, values) onto the 1Hz time grid, one slab per variable,
+    returning the range of indices written, [i0, i1), or None
+    '''
+    tAll = []
+    for key in columns:
+        if key not in nc.variables: continue # Decoded, but not kept, e.g. GGA fix time
+        (t, values) = columns[key]
+        t = (t - tBase).astype("timedelta64[s]").astype(np.int64)
+        qOkay = t >= 0
+        if not qOkay.all():
+            logging.warning("Dropping %s %s records before %s", (~qOkay).sum(), key, tBase)
+            (t, values) = (t[qOkay], values[qOkay])
+        writeSlab(nc.variables[key], t, values)
+        tAll.append(t)
+    if tAll:
+        t = np.unique(np.concatenate(tAll))
+        writeSlab(nc.variables["t"], t, t)
+        if t.size: return (int(t[0]), int(t[-1]) + 1)
+    return None
 
-    for key in df:
-        if key in ["t", "dt"]: continue
-        nc.variables[key][t] = df[key].to_numpy()
-   
 def getTimeOffset(nc) -> np.int64:
     units = nc.variables["t"].getncattr("units")
     since = "since "
     index = units.find(since) + len(since)
     return np.datetime64(units[index:])
 
-def loadIt(paths:list, ncPath:str, dbName:str) -> None:
-    sql = "INSERT INTO filePosition VALUES (%s, %s)"
-    sql+= " ON CONFLICT (filename) DO UPDATE SET position=EXCLUDED.position;"
-
-    with psycopg.connect(f"dbname={dbName}") as db:
-        cur = db.cursor()
-        filenames = mkFilenames(paths, cur)
-
-        for date in sorted(filenames):
-            ofn = os.path.join(ncPath, f"ship.{date}.nc")
-            logging.info("Working on %s %s -> %s", date, len(filenames[date]), ofn)
-            frames = []
-            cur.execute("BEGIN TRANSACTION;")
-            for fn in filenames[date]:
-                t0 = time.time()
-                (df, pos) = loadFile(fn, filenames[date][fn][0], filenames[date][fn][1])
-                t1 = time.time()
-                logging.info("Loaded %s in %s secs, sz %s pos %s", 
-                             os.path.basename(fn), round(t1-t0,1), df.t.size, pos)
-                cur.execute(sql, (fn, pos))
-                if df is not None and not df.empty: 
-                    frames.append(df)
-   
+def appendFiles(db, cur, pool, filenames:dict, ncPath:str, known:dict) -> None:
+    ''' Append the new records in filenames to the daily NetCDF files, updating known '''
+    sql = "INSERT INTO filePosition (filename,position,size,mtime,inode)"
+    sql+= " VALUES (%s,%s,%s,%s,%s)"
+    sql+= " ON CONFLICT (filename) DO UPDATE SET"
+    sql+= " position=EXCLUDED.position,size=EXCLUDED.size,mtime=EXCLUDED.mtime,inode=EXCLUDED.inode;"
+
+    for date in sorted(filenames):
+        ofn = os.path.join(ncPath, f"ship.{date}.nc")
+        logging.info("Working on %s %s -> %s", date, len(filenames[date]), ofn)
+        items = [(fn, filenames[date][fn][0], filenames[date][fn][1]) for fn in filenames[date]]
+        if pool is None:
+            results = [loadColumns(*item) for item in items]
+        else:
+            results = list(pool.map(loadColumns, *zip(*items)))
+
+        frames = []
+        positions = []
+        for (fn, columns, pos, dt) in results:
+            logging.info("Loaded %s in %s secs, sz %s pos %s", os.path.basename(fn), round(dt,1),
+                         0 if columns is None else columns["t"].size, pos)
+            positions.append((fn, pos) + filenames[date][fn][2])
+            if columns is not None: frames.append(columns)
+
+        cur.execute("BEGIN TRANSACTION;")
+        cur.executemany(sql, positions)
+
+        if frames:
             if not os.path.isfile(ofn):
-                tMin = None
-                for df in frames:
-                    tMin = df.t.min() if tMin is None else min(tMin, df.t.min())
-                createNetCDF(ofn, tMin.to_datetime64())
+                tMin = min(columns["t"].min() for columns in frames)
+                createNetCDF(ofn, tMin)
 
             with Dataset(ofn, "a") as nc:
                 tBase = getTimeOffset(nc)
-                for df in frames: saveDataframe(nc, df, tBase)
+                written = saveColumns(nc, mergeColumns(frames), tBase)
+            if written: downsample(ofn, *written, catalog) # Means of just the new seconds
 
-            db.commit()
+        db.commit() # All the file positions, once the NetCDF file is written
+        for item in positions: known[item[0]] = item[1:]
+
+def loadIt(paths:list, ncPath:str, dbName:str, jobs:int=1) -> None:
+    with psycopg.connect(f"dbname={dbName}") as db, \
+            ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else nullcontext() as pool:
+        cur = db.cursor()
+        known = loadKnown(db, cur)
+        appendFiles(db, cur, pool, mkFilenames(paths, known), ncPath, known)
+
+class Tailer(Thread):
+    '''
+    Daemon mode, catch up once, then only look at the files inotify says changed,
+    appending them to the NetCDF files every --cadence seconds
+    '''
+    def __init__(self, args:ArgumentParser, q:queue.Queue) -> None:
+        Thread.__init__(self, "TAIL", args)
+        self.__queue = q
+
+    def runIt(self) -> None:
+        args = self.args
+        q = self.__queue
+        jobs = args.jobs
+        logging.info("Starting cadence %s", args.cadence)
+
+        with psycopg.connect(f"dbname={args.db}") as db, \
+                ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else nullcontext() as pool:
+            cur = db.cursor()
+            known = loadKnown(db, cur)
+            appendFiles(db, cur, pool, mkFilenames(args.directory, known), args.nc, known)
+
+            while True:
+                changed = set()
+                (t0, fn) = q.get() # Wait for something to change
+                q.task_done()
+                changed.add(fn)
+                tNext = time.monotonic() + args.cadence
+                while True: # Collect changes until the cadence is up
+                    dt = tNext - time.monotonic()
+                    if dt <= 0: break
+                    try:
+                        (t0, fn) = q.get(timeout=dt)
+                        q.task_done()
+                        changed.add(fn)
+                    except queue.Empty:
+                        break
+
+                filenames = {}
+                for fn in changed:
+                    subdir = os.path.basename(os.path.dirname(fn))
+                    if subdir in patterns and fn.endswith(".Raw"):
+                        addFilename(filenames, fn, patterns[subdir], known)
+                if filenames: appendFiles(db, cur, pool, filenames, args.nc, known)
 
 if __name__ == "__main__":
-    from argparse import ArgumentParser
     from TPWUtils import Logger
 
     parser = ArgumentParser()
@@ -244,6 +328,11 @@ if __name__ == "__main__":
     parser.add_argument("directory", type=str, nargs="+", help="Directories to look in")
     parser.add_argument("--nc", type=str, required=True, help="Output filename")
     parser.add_argument("--db", type=str, default="arcterx", help="Database name")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of files to parse in parallel")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Keep running, appending files as inotify reports they changed")
+    parser.add_argument("--cadence", type=float, default=10,
+                        help="Seconds between NetCDF appends in --daemon mode")
     args = parser.parse_args()
 
     Logger.mkLogger(args, fmt="%(asctime)s %(levelname)s: %(message)s")
@@ -253,7 +342,27 @@ if __name__ == "__main__":
         directories = []
         for directory in args.directory:
             directories.append(os.path.abspath(os.path.expanduser(directory)))
+        args.directory = directories
+
+        if args.daemon:
+            from TPWUtils import INotify
+            import pyinotify
+
+            # SCS keeps its files open, so watch for modifications too
+            flags = pyinotify.IN_MODIFY | pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO
+            inotify = INotify.INotify(args, flags)
+            tailer = Tailer(args, inotify.queue)
+
+            inotify.start()
+            tailer.start()
+
+            for directory in directories:
+                for subdir in patterns:
+                    if os.path.isdir(os.path.join(directory, subdir)):
+                        inotify.addTree(os.path.join(directory, subdir))
 
-        loadIt(directories, args.nc, args.db)
+            Thread.waitForException()
+        else:
+            loadIt(directories, args.nc, args.db, args.jobs)
     except:
         logging.exception("GotMe")
@@ -15,41 +15,97 @@ import queue
 import re
 import psycopg
 import socket
+import NMEA
+import time
+
+class Writer(Thread):
+    '''
+    Own the database connection, so a slow database does not stall parsing.
+    Fixes are grouped by which columns they set and upserted every --flush seconds,
+    one executemany per column set, in a single transaction.
+    '''
+    def __init__(self, args:ArgumentParser):
+        Thread.__init__(self, "DB", args)
+        self.__queue = queue.Queue()
+        self.__sql = {} # Column names -> upsert statement
+
+    @staticmethod
+    def addArgs(parser:ArgumentParser) -> None:
+        parser.add_argument("--db", type=str, default="arcterx", help="Database name to work on")
+        parser.add_argument("--ship", type=str, default="TGT", help="Vessel name")
+        parser.add_argument("--flush", type=float, default=10,
+                            help="Seconds between database writes")
+
+    def put(self, tFix:datetime.datetime, info:dict) -> None:
+        self.__queue.put((tFix, info))
+
+    def __mkSQL(self, names:tuple) -> str:
+        # The same string for a column set, so psycopg prepares it server side once reused
+        if names not in self.__sql:
+            sql = "INSERT INTO ship (id,t," + ",".join(names) + ")"
+            sql+= " VALUES (" + ",".join(["%s"] * (len(names) + 2)) + ")"
+            sql+= " ON CONFLICT (t,id) DO UPDATE SET "
+            sql+= ",".join(key + "=excluded." + key for key in names) + ";"
+            self.__sql[names] = sql
+        return self.__sql[names]
+
+    def __flush(self, db, rows:dict) -> None:
+        with db.transaction():
+            cur = db.cursor()
+            for names in rows:
+                cur.executemany(self.__mkSQL(names), rows[names])
+        logging.debug("Wrote %s rows", sum(len(rows[names]) for names in rows))
+
+    def runIt(self) -> None:
+        q = self.__queue
+        args = self.args
+        ship = args.ship
+        dt = args.flush
+
+        logging.info("Starting db=%s flush=%s", args.db, dt)
+
+        with psycopg.connect(f"dbname={args.db}", autocommit=True) as db:
+            rows = {} # Column names -> list of rows
+            tNext = None # When to write pending rows
+            while True:
+                try:
+                    (tFix, info) = q.get(timeout=None if tNext is None \
+                            else max(0, tNext - time.monotonic()))
+                    q.task_done()
+                    names = tuple(key for key in info if info[key] is not None)
+                    if names:
+                        rows.setdefault(names, []).append(
+                                (ship, tFix) + tuple(info[key] for key in names))
+                        if tNext is None: tNext = time.monotonic() + dt
+                except queue.Empty:
+                    pass
+                if tNext is not None and time.monotonic() >= tNext:
+                    self.__flush(db, rows)
+                    rows = {}
+                    tNext = None
 
 class Consumer(Thread):
-    def __init__(self, args:ArgumentParser):
+    def __init__(self, args:ArgumentParser, writer:Writer):
         Thread.__init__(self, "CON", args)
         self.__queue = queue.Queue()
-        self.__ship = args.ship
+        self.__writer = writer
         self.__gap = datetime.timedelta(seconds=args.gap)
-        self.__tRMC = None
-        self.__tGGA = None
+        # Sentence type -> columns stored in the ship table
+        self.__stored = {
+                "RMC": ("lat", "lon", "sog", "cog", "magVar"),
+                "GGA": ("lat", "lon", "dilution", "altitude", "height"),
+                }
 
     @staticmethod
     def addArgs(parser:ArgumentParser) -> None:
         parser.add_argument("--gap", type=int, default=60, help="Seconds between db updates")
-        parser.add_argument("--db", type=str, default="arcterx", help="Database name to work on")
-        parser.add_argument("--ship", type=str, default="TGT", help="Vessel name")
 
     def put(self, port:int, t:datetime.datetime, ipv4:str, sport:int, body:bytes) -> None:
-        self.__queue.put((port, t, ipv4, sport, body))
+        self.__queue.put([(port, t, ipv4, sport, body)])
 
-    @staticmethod
-    def __decodeDegMin(degmin:str, direction:str) -> float:
-        if not degmin: return None
-        sgn = -1 if direction.upper() in ["S", "W"] else 1
-        degmin = float(degmin)
-        sgn *= -1 if degmin < 0 else 1
-        degmin = abs(degmin)
-        deg = math.floor(degmin / 100)
-        minutes = degmin % 100
-        return sgn * (deg + minutes / 60)
-
-    @staticmethod
-    def __decodeMagVar(degrees:str, direction:str) -> float:
-        if not degrees: return None
-        sgn = -1 if direction.upper() in ["S", "W"] else 1
-        return sgn * float(degrees)
+    def putBatch(self, items:list) -> None:
+        ''' items is a list of (port, t, ipv4, sport, body) '''
+        if items: self.__queue.put(items)
 
     @staticmethod
     def __decodeFixTime(t:datetime.datetime, tt:str) -> datetime.datetime:
@@ -73,83 +129,40 @@ class Consumer(Thread):
         tt = tt.replace(tzinfo=datetime.timezone.utc)
         return tt
 
-    def __dbUpdate(self, db, tFix:datetime.datetime, info:dict) -> None:
-        names = ["id", "t"]
-        values = [self.__ship, tFix]
-        updates = []
-
-        for key in info:
-            if info[key] is not None:
-                names.append(key)
-                values.append(info[key])
-                updates.append(key + "=excluded." + key)
-
-        if len(names) < 3: return
-
-        sql = "INSERT INTO ship (" + ",".join(names) + ")"
-        sql+= " VALUES (" + ",".join(["%s"] * len(names)) + ")"
-        sql+= " ON CONFLICT (t,id) DO UPDATE SET " + ",".join(updates) + ";"
-        cur = db.cursor();
-        cur.execute("BEGIN TRANSACTION;")
-        cur.execute(sql, values)
-        db.commit()
-
-    def __RMC(self, port:int, t:datetime.datetime, ipv4:str, sport, fields:list, db) -> None:
-        if fields[2] != "A": return # Not active
-        info = {}
-        tFix = self.__decodeFixTime(t, fields[1])
-        if tFix is None: return
-        info["lat"] = self.__decodeDegMin(fields[3], fields[4])
-        info["lon"] = self.__decodeDegMin(fields[5], fields[6])
-        info["sog"] = float(fields[7])
-        info["cog"] = float(fields[8])
-        dFix = self.__decodeFixDate(t, fields[9])
-        info["magVar"] = self.__decodeMagVar(fields[10], fields[11])
-
-        tFix = datetime.datetime.combine(dFix.date(), tFix.time(), tzinfo=datetime.timezone.utc)
-
-        if self.__tRMC and tFix < self.__tRMC: return
-        self.__tRMC = tFix + self.__gap # When to write next time
-
-        self.__dbUpdate(db, tFix, info)
-
-    def __GGA(self, port:int, t:datetime.datetime, ipv4:str, sport, fields:list, db) -> None:
-        info = {}
-        tFix = self.__decodeFixTime(t, fields[1])
-        if tFix is None: return
-
-        info["lat"] = self.__decodeDegMin(fields[2], fields[3])
-        info["lon"] = self.__decodeDegMin(fields[4], fields[5])
-        fixQuality = int(fields[6]) if fields[6] else None
-        if fixQuality == 0: return
-        info["dilution"] = float(fields[8]) if fields[8] else None
-        info["altitude"] = float(fields[9]) if fields[9] else None
-        info["height"] = float(fields[11]) if fields[11] else None
-
-        if self.__tGGA and tFix < self.__tGGA: return
-        self.__tGGA = tFix + self.__gap # When to write next time
-
-        self.__dbUpdate(db, tFix, info)
+    def __fixTime(self, t:datetime.datetime, info:dict) -> datetime.datetime:
+        tFix = self.__decodeFixTime(t, info.get("fixTime"))
+        if tFix is None: return None
+        dFix = self.__decodeFixDate(t, info.get("fixDate"))
+        if dFix is None: return tFix
+        return datetime.datetime.combine(dFix.date(), tFix.time(), tzinfo=datetime.timezone.utc)
 
     def runIt(self) -> None:
         q = self.__queue
-        dbName = self.args.db
+        stored = self.__stored
+        tNext = {} # Sentence type -> when to write next time
 
-        logging.info("Starting db=%s", dbName)
+        logging.info("Starting")
 
-        with psycopg.connect(f"dbname={dbName}") as db:
-            while True:
-                (port, t, ipv4, sport, body) = q.get()
-                q.task_done()
+        while True:
+            items = q.get()
+            q.task_done()
+            for (port, t, ipv4, sport, body) in items:
                 fields = body.split(",")
-                if fields[0].endswith("RMC"):
-                    self.__RMC(port, t, ipv4, sport, fields, db)
-                elif fields[0].endswith("GGA"):
-                    self.__GGA(port, t, ipv4, sport, fields, db)
-                elif not re.fullmatch(r"[$]..(VTG|HDT|ZDA)", fields[0]):
+                parser = NMEA.lookup(fields[0])
+                if parser is None:
                     logging.warning("Unrecognized sentence type %s", fields[0])
-                    logging.info("port=%s t=%s addr=%s port=%s body=%s", port, t, ipv4, sport, body)
+                    logging.info("port=%s t=%s addr=%s port=%s body=%s",
+                                 port, t, ipv4, sport, body)
                     logging.info("%s", fields)
+                    continue
+                if parser.name not in stored: continue # Nothing for the ship table
+                info = parser(fields)
+                if not info: continue # Not active or no fix
+                tFix = self.__fixTime(t, info)
+                if tFix is None: continue
+                if parser.name in tNext and tFix < tNext[parser.name]: continue
+                tNext[parser.name] = tFix + self.__gap # When to write next time
+                self.__writer.put(tFix, {key: info.get(key) for key in stored[parser.name]})
 
 class Listener(Thread):
     def __init__(self, port:int, consumer:Consumer, args:ArgumentParser):
@@ -157,6 +170,11 @@ class Listener(Thread):
         self.__port = port
         self.__consumer = consumer
 
+    @staticmethod
+    def addArgs(parser:ArgumentParser) -> None:
+        parser.add_argument("--batch", type=int, default=256,
+                            help="Maximum number of datagrams to read per wakeup")
+
     @staticmethod
     def __nemaOk(body:bytes, chksum:bytes) -> bool:
         a = 0
@@ -169,18 +187,30 @@ class Listener(Thread):
         q = self.__consumer
         port = self.__port
         logging.info("Starting Listener for %s", port)
+        nBatch = self.args.batch
+        expr = re.compile(b"^([$][A-Z0-9]+,.+)[*]([0-9A-Fa-f]{2})$")
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         sock.bind(("", port))
         while True:
-            (data, addr) = sock.recvfrom(4096)
-            t = datetime.datetime.now(tz=datetime.timezone.utc)
-            (ipv4, sport) = addr
-            for sentence in data.split():
-                fields = re.match(b"^([$][A-Z]+,.+)[*]([\d[A-Fa-f]{2})$", sentence)
-                if not fields: continue
-                if not self.__nemaOk(fields[1], fields[2]): continue
-                # logging.info("port %s t %s ipv4 %s sport %s\n%s", port, t, ipv4, sport, sentence)
-                q.put(port, t, ipv4, sport, str(fields[1], "utf-8"))
+            # Wait for a datagram, then drain everything else waiting,
+            # so there is one queue put per wakeup, each datagram has its own timestamp
+            datagrams = []
+            try:
+                for i in range(nBatch):
+                    (data, addr) = sock.recvfrom(4096, socket.MSG_DONTWAIT if datagrams else 0)
+                    datagrams.append((datetime.datetime.now(tz=datetime.timezone.utc), data, addr))
+            except BlockingIOError:
+                pass
+            items = []
+            for (t, data, addr) in datagrams:
+                (ipv4, sport) = addr
+                for sentence in data.split():
+                    fields = expr.match(sentence)
+                    if not fields: continue
+                    if not self.__nemaOk(fields[1], fields[2]): continue
+                    # logging.info("port %s t %s ipv4 %s sport %s\n%s", port, t, ipv4, sport, sentence)
+                    items.append((port, t, ipv4, sport, str(fields[1], "utf-8")))
+            q.putBatch(items)
 
 class Replay(Thread):
     def __init__(self, consumer:Consumer, args:ArgumentParser):
@@ -221,27 +251,31 @@ class Replay(Thread):
                 body = str(matches[6], "utf-8")
                 for item in re.split(r"\\[rn]", body):
                     if len(item) < 4: continue
-                    fields = re.match(r"^([$][A-Z]+,.+)[*]([\d[A-Fa-f]{2})$", item)
+                    fields = NMEA.SENTENCE.match(item)
                     if not fields: continue
                     if not self.__nemaOk(fields[1], fields[2]): continue
                     q.put(port, t, ipv4, sport, fields[1])
 
 parser = ArgumentParser()
 Logger.addArgs(parser)
+Writer.addArgs(parser)
 Consumer.addArgs(parser)
+Listener.addArgs(parser)
 Replay.addArgs(parser)
 parser.add_argument("port", type=int, nargs="+", help="UDP ports to listen to")
 args = parser.parse_args()
 
 Logger.mkLogger(args)
 
-thrds = [Consumer(args)]
+writer = Writer(args)
+consumer = Consumer(args, writer)
+thrds = [writer, consumer]
 
 for port in args.port:
-    thrds.append(Listener(port, thrds[0], args))
+    thrds.append(Listener(port, consumer, args))
 
 if args.replay:
-    thrds.append(Replay(thrds[0], args))
+    thrds.append(Replay(consumer, args))
 
 for thrd in thrds:
     thrd.start()
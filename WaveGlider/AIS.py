@@ -6,12 +6,9 @@
 
 from TPWUtils import Logger
 from argparse import ArgumentParser
-import pandas as pd
 import sqlite3
 import os
 import time
-import datetime
-import sys
 
 parser = ArgumentParser()
 Logger.addArgs(parser)
@@ -19,6 +16,8 @@ parser.add_argument("--db", type=str, default="~/logs/ais.db", help="AIS databas
 parser.add_argument("--csv", type=str, default="~/Sync.ARCTERX/Ship/WaveGlider/ais.csv",
         help="AIS fixes for the WaveGlider")
 parser.add_argument("--dt", type=float, default=15, help="Seconds between DB queries")
+parser.add_argument("--mmsi", type=int, action="append",
+        help="Only extract these MMSIs, default is all of them")
 parser.add_argument("--force", action="store_true", help="Force rebuilding the CSV file")
 args = parser.parse_args()
 
@@ -29,12 +28,28 @@ args.csv = os.path.abspath(os.path.expanduser(args.csv))
 
 os.makedirs(os.path.dirname(args.csv), mode=0o755, exist_ok=True)
 
-sqlX = "CREATE TEMPORARY TABLE xx AS SELECT mmsi,t,value AS lon FROM ais WHERE key='x';"
-sqlY = "CREATE TEMPORARY TABLE yy AS SELECT mmsi,t,value AS lat FROM ais WHERE key='y';"
-sqlJ = "SELECT xx.mmsi,datetime(xx.t, 'unixepoch') as dt,lon,lat,xx.t FROM xx"
-sqlJ+= " INNER JOIN yy"
-sqlJ+= " ON xx.mmsi=yy.mmsi AND xx.t==yy.t AND xx.t>?"
-sqlJ+= " ORDER by xx.t;"
+def lastTime(fn:str) -> float:
+    """ seconds column of the last line in the CSV file """
+    with open(fn, "rb") as fp:
+        fp.seek(0, os.SEEK_END)
+        fp.seek(max(0, fp.tell() - 4096)) # Only read the tail of the file
+        lines = fp.read().splitlines()
+    for line in reversed(lines):
+        try:
+            return float(line.split(b",")[-1])
+        except ValueError: # Header or partial line
+            pass
+    return 0
+
+# Self join x and y rows for the same (mmsi,t) primary key,
+# only looking at rows newer than the high water mark via the (key,t) index
+sql = "SELECT x.mmsi,datetime(x.t, 'unixepoch') as dt,x.value,y.value,x.t FROM ais AS x"
+sql+= " INNER JOIN ais AS y"
+sql+= " ON y.mmsi=x.mmsi AND y.key='y' AND y.t=x.t"
+sql+= " WHERE x.key='x' AND x.t>?"
+if args.mmsi:
+    sql+= " AND x.mmsi IN (" + ",".join(["?"] * len(args.mmsi)) + ")"
+sql+= " ORDER BY x.t;"
 
 if args.force or not os.path.isfile(args.csv):
     logger.info("Creating header")
@@ -42,21 +57,19 @@ if args.force or not os.path.isfile(args.csv):
         fp.write("mmsi,t,lat,lon,seconds\n")
     tPrev = 0
 else:
-    df = pd.read_csv(args.csv)
-    tPrev = max(df.seconds)
-
-while True:
-    logger.info("tPrev %s", tPrev)
-    info = {}
-    with sqlite3.connect(args.db) as db, open(args.csv, "a") as fp:
-        cur = db.cursor()
-        cur.execute(sqlX)
-        cur.execute(sqlY)
+    tPrev = lastTime(args.csv)
+
+# Read-only, AIS2DB owns the database and builds the (key,t) index
+with sqlite3.connect(f"file:{args.db}?mode=ro", uri=True) as db, open(args.csv, "a") as fp:
+    cur = db.cursor()
+    while True:
+        logger.info("tPrev %s", tPrev)
         cnt = 0
-        for row in cur.execute(sqlJ, (tPrev,)):
+        for row in cur.execute(sql, [tPrev] + (args.mmsi or [])):
             tPrev = row[4]
             fp.write(",".join([str(row[0]), row[1], str(row[2]), str(row[3]), str(tPrev)]) + "\n")
             cnt += 1
+        fp.flush()
 
-    logger.info("Wrote %s, sleeping for %s %s", cnt, args.dt, tPrev)
-    time.sleep(args.dt)
+        logger.info("Wrote %s, sleeping for %s %s", cnt, args.dt, tPrev)
+        time.sleep(args.dt)